@@ -0,0 +1,291 @@
+"""JSON HTTP API exposing the mortgage simulation and tax engine.
+
+Run alongside the Streamlit UI (nginx routes /api/ here):
+
+    python api.py --port 8502 --workers 4
+"""
+
+import argparse
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.process
+import tornado.web
+
+from export import ARROW_STREAM_MIME, schedule_table, scenarios_table, to_arrow_stream
+from mortgage import (
+    INPUT_RANGES,
+    build_scenario,
+    calculate_ca_tax_2025,
+    calculate_effective_tax_rate,
+    calculate_federal_tax_2025,
+    calculate_fica_tax_2025,
+    calculate_tax_benefit,
+    summarize,
+)
+from scenario_cache import ScenarioCache, open_disk_cache
+
+MAX_BATCH = 256
+CACHE = ScenarioCache(maxsize=1024, disk=open_disk_cache())
+# Requests are simulated off the IOLoop; NumPy and the numba kernel release the GIL
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+SCENARIO_FIELDS = (
+    "price",
+    "down",
+    "rate",
+    "term_years",
+    "tax_month",
+    "ins_month",
+    "tax_appreciation",
+    "method",
+    "recast_int",
+    "initial_cash",
+    "surplus",
+    "buffer_cash",
+    "lump",
+    "benefit_income",
+    "start_month",
+    "tax_escalation",
+    "tax_cap",
+    "ins_inflation",
+    "rate_events",
+)
+TEXT_FIELDS = ("method", "tax_escalation")
+RATE_EVENT_FIELDS = ("month", "rate", "kind", "closing_costs")
+
+
+def finite_number(value):
+    """True for a JSON number other than NaN/Infinity (booleans are not numbers)"""
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def parse_scenario(params):
+    """Validate a request object and return its build_scenario() dict"""
+    if not isinstance(params, dict):
+        raise ValueError("a scenario must be a JSON object")
+    unknown = set(params) - set(SCENARIO_FIELDS) - {"months"}
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+    missing = [f for f in SCENARIO_FIELDS[:6] if f not in params]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    if "rate_events" in params:
+        parse_rate_events(params["rate_events"])
+    for field in SCENARIO_FIELDS:
+        if field in params and field not in TEXT_FIELDS + ("rate_events",):
+            if not finite_number(params[field]):
+                raise ValueError(f"{field} must be a number")
+            if field in INPUT_RANGES:
+                low, high, _ = INPUT_RANGES[field]
+                if not low <= params[field] <= high:
+                    raise ValueError(f"{field} must be between {low:,} and {high:,}")
+    return build_scenario(**{k: v for k, v in params.items() if k != "months"})
+
+
+def parse_rate_events(events):
+    """Check the JSON types of a scenario's rate_events (build_scenario() the rest)"""
+    if not isinstance(events, list) or not all(isinstance(e, dict) for e in events):
+        raise ValueError("rate_events must be a list of objects")
+    for event in events:
+        unknown = set(event) - set(RATE_EVENT_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown rate event fields: {', '.join(sorted(unknown))}")
+        month = event.get("month")
+        if not isinstance(month, int) or isinstance(month, bool):
+            raise ValueError("a rate event month must be an integer")
+        if not finite_number(event.get("rate")):
+            raise ValueError("a rate event rate must be a number")
+        low, high, _ = INPUT_RANGES["rate"]
+        if not low <= event["rate"] <= high:
+            raise ValueError(f"a rate event rate must be between {low} and {high}")
+        if "closing_costs" in event and not finite_number(event["closing_costs"]):
+            raise ValueError("closing_costs must be a number")
+        if not isinstance(event.get("kind", ""), str):
+            raise ValueError("a rate event kind must be a string")
+
+
+def parse_months(params):
+    """Optional horizon of a request item"""
+    months = params.get("months")
+    if months is not None and (
+        not isinstance(months, int) or isinstance(months, bool) or months < 1
+    ):
+        raise ValueError("months must be a positive integer")
+    return months
+
+
+def schedules(items):
+    """Cached schedules for request items, each simulated only to its horizon.
+
+    Identical scenarios (e.g. embedded widgets) are served from memory; the
+    misses of each horizon are simulated together in one batch.
+    """
+    parsed = [(parse_scenario(params), parse_months(params)) for params in items]
+    by_horizon = {}
+    for i, (_, months) in enumerate(parsed):
+        by_horizon.setdefault(months, []).append(i)
+    results = [None] * len(items)
+    for months, positions in by_horizon.items():
+        batch = CACHE.schedules_many([parsed[i][0] for i in positions], months)
+        for i, result in zip(positions, batch):
+            results[i] = result
+    return results
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json")
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+    def requests(self):
+        """Return (items, batched): a body may be one object or {"batch": [...]}"""
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, reason="body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="body must be a JSON object")
+        if "batch" not in body:
+            return [body], False
+        batch = body["batch"]
+        if not isinstance(batch, list) or not batch:
+            raise tornado.web.HTTPError(400, reason="batch must be a non-empty list")
+        if len(batch) > MAX_BATCH:
+            raise tornado.web.HTTPError(
+                400, reason=f"batch is limited to {MAX_BATCH} items"
+            )
+        return batch, True
+
+    async def run(self, handle, items):
+        """handle(items) in the executor; bad input becomes a 400"""
+        loop = tornado.ioloop.IOLoop.current()
+        try:
+            return await loop.run_in_executor(EXECUTOR, handle, items)
+        except (TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+
+    async def respond(self, handle):
+        """handle() maps the list of request items to a list of results"""
+        items, batched = self.requests()
+        results = await self.run(handle, items)
+        self.finish({"results": results} if batched else results[0])
+
+
+class SimulateHandler(BaseHandler):
+    async def post(self):
+        if self.get_query_argument("format", "json") == "arrow":
+            return await self.arrow()
+        await self.respond(self.simulate)
+
+    async def arrow(self):
+        """Arrow IPC stream; batches are stacked with a Scenario column (item index)"""
+        items, _ = self.requests()
+        stream = await self.run(self.arrow_stream, items)
+        self.set_header("Content-Type", ARROW_STREAM_MIME)
+        self.finish(stream)
+
+    @staticmethod
+    def arrow_stream(items):
+        tables = [schedule_table(*frames) for frames in schedules(items)]
+        return to_arrow_stream(scenarios_table(tables, range(len(tables))))
+
+    @staticmethod
+    def simulate(items):
+        # Columnar JSON: one list per column
+        return [
+            {
+                "recast": df.to_dict(orient="list"),
+                "no_recast": df_no_recast.to_dict(orient="list"),
+            }
+            for df, df_no_recast in schedules(items)
+        ]
+
+
+class SummaryHandler(BaseHandler):
+    async def post(self):
+        await self.respond(self.summary)
+
+    @staticmethod
+    def summary(items):
+        return [summarize(*frames) for frames in schedules(items)]
+
+
+class TaxHandler(BaseHandler):
+    async def post(self):
+        await self.respond(self.taxes)
+
+    def taxes(self, items):
+        return [self.tax(params) for params in items]
+
+    @staticmethod
+    def tax(params):
+        income = params["income"] if "income" in params else None
+        if not finite_number(income) or income < 0:
+            raise ValueError("income must be a non-negative number")
+        filing_status = params.get("filing_status", "married")
+        if filing_status not in ("married", "single"):
+            raise ValueError("filing_status must be 'married' or 'single'")
+
+        result = {
+            "federal": calculate_federal_tax_2025(income, filing_status),
+            "state": calculate_ca_tax_2025(income, filing_status),
+            "fica": calculate_fica_tax_2025(income, filing_status),
+            "effective_rate": calculate_effective_tax_rate(income, filing_status),
+        }
+        # Deduction benefit is optional: needs the year's interest, monthly tax and loan
+        if "yearly_interest" in params:
+            # Without the loan the interest deduction would silently be zero
+            if "loan" not in params:
+                raise ValueError("loan is required with yearly_interest")
+            for field in ("yearly_interest", "property_tax", "loan"):
+                if field in params and not finite_number(params[field]):
+                    raise ValueError(f"{field} must be a number")
+            result["tax_benefit"] = calculate_tax_benefit(
+                params["yearly_interest"],
+                params.get("property_tax", 0),
+                income,
+                params["loan"],
+                filing_status,
+            )
+        return result
+
+
+def make_app():
+    return tornado.web.Application(
+        [
+            (r"/simulate", SimulateHandler),
+            (r"/summary", SummaryHandler),
+            (r"/tax", TaxHandler),
+        ]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="processes sharing the socket (0 = CPUs)"
+    )
+    args = parser.parse_args()
+
+    sockets = tornado.netutil.bind_sockets(args.port, address=args.address)
+    if args.workers != 1:
+        tornado.process.fork_processes(args.workers)
+    server = tornado.httpserver.HTTPServer(make_app())
+    server.add_sockets(sockets)
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Property tax and insurance escalation over a loan's months.
+
+Each model is a closed-form multiplier over months 1..M, so escalation is
+computed once per scenario as an array (not re-evaluated inside the month
+loops) and shared by the recast and no-recast tracks. Batched runs compute
+one row per distinct set of escalation inputs and share it between every
+scenario using it.
+"""
+
+import numpy as np
+
+TAX_ESCALATIONS = ("Compound", "Annual reassessment")
+# California's Proposition 13 limits assessed-value increases to 2% a year
+DEFAULT_REASSESSMENT_CAP = 2.0
+
+
+def compound_growth(annual_pct, months):
+    """(1 + pct)^(m / 12) for months 1..months; a bit of growth every month"""
+    months_elapsed = np.arange(1, months + 1) / 12
+    return (1 + np.asarray(annual_pct) / 100) ** months_elapsed
+
+
+def annual_steps(annual_pct, months, cap=None):
+    """Growth applied once a year, from month 13 on, each step at most ``cap`` %"""
+    annual_pct = np.asarray(annual_pct, dtype=float)
+    if cap is not None:
+        annual_pct = np.minimum(annual_pct, cap)
+    years_elapsed = np.arange(months) // 12
+    return (1 + annual_pct / 100) ** years_elapsed
+
+
+def tax_growth(
+    tax_appreciation, months, escalation="Compound", cap=DEFAULT_REASSESSMENT_CAP
+):
+    """Property tax multiplier for months 1..months (broadcasts over an array).
+
+    "Compound" grows the tax continuously at ``tax_appreciation`` % a year.
+    "Annual reassessment" raises it on each loan anniversary by the
+    appreciation, but by no more than ``cap`` % (a Prop 13 style limit).
+    """
+    if escalation == "Compound":
+        return compound_growth(tax_appreciation, months)
+    if escalation == "Annual reassessment":
+        return annual_steps(tax_appreciation, months, cap)
+    raise ValueError(f"tax escalation must be one of {TAX_ESCALATIONS}")
+
+
+def insurance_growth(ins_inflation, months):
+    """Insurance multiplier: premiums renew yearly at ``ins_inflation`` % more"""
+    return annual_steps(ins_inflation, months)
+
+
+def escalation_arrays(b, months):
+    """(N, months) property tax and insurance payments for scenario_arrays() input"""
+    # Sweeps draw these from a few values, so evaluate each distinct row once
+    params = np.stack(
+        (b["annual_reassessment"], b["tax_appreciation"], b["tax_cap"]), axis=1
+    )
+    unique, inverse = np.unique(params, axis=0, return_inverse=True)
+    reassessed, appreciation, cap = (col[:, None] for col in unique.T)
+    growth = np.where(
+        reassessed.astype(bool),
+        annual_steps(appreciation, months, cap),
+        compound_growth(appreciation, months),
+    )
+    inflation, ins_inverse = np.unique(b["ins_inflation"], return_inverse=True)
+    ins_growth = insurance_growth(inflation[:, None], months)
+    return (
+        b["tax"][:, None] * growth[inverse.ravel()],
+        b["ins"][:, None] * ins_growth[ins_inverse.ravel()],
+    )
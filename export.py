@@ -0,0 +1,62 @@
+"""Arrow/Parquet/Feather export of simulated schedules.
+
+Columns go from the pandas/NumPy buffers straight into Arrow arrays (float64
+columns without nulls are wrapped, not copied), so exports never pass through
+CSV string formatting.
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+PARQUET_MIME = "application/vnd.apache.parquet"
+FEATHER_MIME = "application/vnd.apache.arrow.file"
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+
+
+def column_array(series):
+    """Flags stay boolean; amounts are float64 so every scenario shares a schema"""
+    if series.dtype == bool:
+        return pa.array(series.to_numpy())
+    return pa.array(series.to_numpy(dtype="float64"))
+
+
+def schedule_table(df, df_no_recast):
+    """One row per month: recast columns plus NoRecast* columns for the baseline"""
+    columns = {col: column_array(df[col]) for col in df.columns}
+    for col in df_no_recast.columns:
+        if col != "Month":
+            columns[f"NoRecast{col}"] = column_array(df_no_recast[col])
+    columns["Month"] = pa.array(df["Month"].to_numpy(dtype="int16"))
+    return pa.table(columns)
+
+
+def scenarios_table(tables, names):
+    """Stack per-scenario tables with a dictionary-encoded Scenario column"""
+    stacked = []
+    for table, name in zip(tables, names):
+        labels = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(table.num_rows, dtype=np.int32)), pa.array([str(name)])
+        )
+        stacked.append(table.add_column(0, "Scenario", labels))
+    return pa.concat_tables(stacked)
+
+
+def to_parquet(table):
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue().to_pybytes()
+
+
+def to_feather(table):
+    sink = pa.BufferOutputStream()
+    feather.write_feather(table, sink, compression="zstd")
+    return sink.getvalue().to_pybytes()
+
+
+def to_arrow_stream(table):
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
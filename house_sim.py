@@ -1,3 +1,7 @@
+import calendar
+import math
+import uuid
+
 import streamlit as st
 import pandas as pd
 import numpy as np
@@ -6,399 +10,274 @@ from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 from streamlit_theme import st_theme
 
+from export import FEATHER_MIME, PARQUET_MIME, schedule_table, to_feather, to_parquet
+from mortgage import (
+    DEFAULT_REASSESSMENT_CAP,
+    INPUT_RANGES,
+    MAX_PRICE,
+    PORTFOLIO_PRIORITIES,
+    RATE_EVENT_KINDS,
+    TAX_ESCALATIONS,
+    amortize_segments,
+    build_scenario,
+    calculate_effective_tax_rate,
+    goal_seek,
+    rate_path_arrays,
+    refinance_break_even,
+    rent_vs_buy,
+    sample_return_paths,
+    segment_schedule,
+    simulate_batch,
+    simulate_portfolio,
+    tax_benefit_income,
+)
+from prefetch import Prefetcher
+from scenario_cache import ScenarioCache, open_disk_cache
+from schedule_chart import schedule_chart, schedule_payload
+from session_memory import current_session_id, monitor_from_env
 
-# ---------------- Helper Functions ----------------
-def calculate_fica_tax_2025(income, filing_status="married"):
-    """Calculate FICA (Social Security and Medicare) taxes"""
-    ss_wage_limit = 167700  # 2025 Social Security wage base
-    medicare_additional_threshold = 250000 if filing_status == "married" else 200000
 
-    # Social Security (6.2% up to wage base limit)
-    ss_tax = min(income, ss_wage_limit) * 0.062
+@st.cache_resource
+def snapshot_store():
+    """Schedules shared by all sessions (and, on disk, by all processes and restarts)"""
+    return ScenarioCache(maxsize=256, disk=open_disk_cache())
 
-    # Medicare (1.45% + 0.9% additional on high incomes)
-    medicare_tax = income * 0.0145
-    if income > medicare_additional_threshold:
-        medicare_tax += (income - medicare_additional_threshold) * 0.009
 
-    return ss_tax + medicare_tax
+@st.cache_resource
+def prefetcher():
+    return Prefetcher(snapshot_store())
 
 
-def calculate_federal_tax_2025(income, filing_status="married"):
-    """Calculate federal tax for 2025 - married filing jointly"""
-    if filing_status == "married":
-        upper_rates = [
-            (23850, 0.10),
-            (96950, 0.12),
-            (206700, 0.22),
-            (394600, 0.24),
-            (501050, 0.32),
-            (751600, 0.35),
-            (float("inf"), 0.37),
-        ]
-    else:  # single
-        upper_rates = [
-            (11925, 0.10),
-            (48475, 0.12),
-            (103350, 0.22),
-            (197300, 0.24),
-            (250525, 0.32),
-            (626350, 0.35),
-            (float("inf"), 0.37),
-        ]
-    brackets = []
-    for i, rate in enumerate(upper_rates):
-        if i == 0:
-            brackets.append((0, rate[0], rate[1]))
-        else:
-            brackets.append((upper_rates[i - 1][0], rate[0], rate[1]))
-
-    tax = 0
-    for i, (lower, upper, rate) in enumerate(brackets):
-        if income > lower:
-            taxable_amount = min(income - lower, upper - lower)
-            tax += taxable_amount * rate
-
-    return tax
-
-
-def calculate_ca_tax_2025(income, filing_status="married"):
-    """Calculate California state tax for 2025 - married filing jointly"""
-    if filing_status == "married":
-        upper_rates = [
-            (20198, 0.01),
-            (47884, 0.02),
-            (75576, 0.04),
-            (104910, 0.06),
-            (132590, 0.08),
-            (677278, 0.093),
-            (812728, 0.103),
-            (1354550, 0.113),
-            (float("inf"), 0.123),
-        ]
-    else:  # single
-        upper_rates = [
-            (10099, 0.01),
-            (23942, 0.02),
-            (37788, 0.04),
-            (52455, 0.06),
-            (66295, 0.08),
-            (338639, 0.093),
-            (406364, 0.103),
-            (677275, 0.113),
-            (float("inf"), 0.123),
-        ]
-    brackets = []
-    for i, rate in enumerate(upper_rates):
-        if i == 0:
-            brackets.append((0, rate[0], rate[1]))
-        else:
-            brackets.append((upper_rates[i - 1][0], rate[0], rate[1]))
-
-    tax = 0
-    for i, (lower, upper, rate) in enumerate(brackets):
-        if income > lower:
-            taxable_amount = min(income - lower, upper - lower)
-            tax += taxable_amount * rate
-
-    return tax
-
-
-def calculate_effective_tax_rate(income, filing_status="married"):
-    """Calculate combined effective tax rate including federal, CA state, and FICA taxes"""
-    federal_tax = calculate_federal_tax_2025(income, filing_status)
-    ca_tax = calculate_ca_tax_2025(income, filing_status)
-    fica_tax = calculate_fica_tax_2025(income, filing_status)
-    total_tax = federal_tax + ca_tax + fica_tax
-    return (total_tax / income) * 100 if income > 0 else 0
-
-
-def payment(balance, months_left, r_monthly):
-    return balance * r_monthly / (1 - (1 + r_monthly) ** -months_left)
-
-
-def simulate(term_mo, r_mo, tax, ins):
-    balance = loan
-    p_i = payment(balance, term_mo, r_mo)
-    savings = initial_cash  # Start with initial cash
-    cum_paid = 0
-    cum_recast = 0
-    rows = []
-
-    # Continue to term_mo even after loan is paid, for tax/insurance
-    for m in range(1, term_mo + 1):
-        # Calculate appreciated property tax for this month
-        current_tax = tax * (1 + tax_appreciation / 100) ** (m / 12)
-
-        # pay mortgage this month
-        interest = balance * r_mo if balance > 0 else 0
-        principal = p_i - interest if balance > 0 else 0
-        if balance > 0:
-            balance -= principal
-        total_pmt = (p_i if balance > 0 else 0) + current_tax + ins
-
-        # Calculate tax benefit for this month
-        monthly_tax_benefit = 0
-        if use_secondary == "Secondary Income" and gross_income2 > 0:
-            monthly_tax_benefit = (
-                calculate_tax_benefit(interest * 12, current_tax, gross_income2) / 12
-            )
-        elif gross_income > 0:
-            monthly_tax_benefit = (
-                calculate_tax_benefit(interest * 12, current_tax, gross_income) / 12
-            )
+@st.cache_resource
+def session_monitor():
+    """Per-session memory ledger; recycles the worker when it is idle and too big"""
+    return monitor_from_env()
 
-        recast_amount = 0
-        # handle savings / lump only if there's still a balance
-        if balance > 0:
-            savings += surplus  # Add monthly savings first
-            if method == "Savings-based":
-                if m % recast_int == 0:
-                    extra = max(0, savings - buffer_cash)
-                    if extra > 0:
-                        recast_amount = min(
-                            extra, balance
-                        )  # Don't recast more than remaining balance
-                        balance -= recast_amount
-                        savings -= recast_amount
-                        if balance <= 0:
-                            p_i = 0
-                        else:
-                            p_i = payment(balance, term_mo - m, r_mo)
-            else:  # fixed lump
-                if m % recast_int == 0 and lump > 0 and savings >= lump:
-                    recast_amount = min(
-                        lump, balance
-                    )  # Don't recast more than remaining balance
-                    balance -= recast_amount
-                    savings -= recast_amount
-                    if balance <= 0:
-                        p_i = 0
-                    else:
-                        p_i = payment(balance, term_mo - m, r_mo)
-
-        cum_recast += recast_amount
-        cum_paid += total_pmt  # Only include regular payment in cumulative
-
-        rows.append(
-            {
-                "Month": m,
-                "P&I": p_i if balance > 0 else 0,
-                "Tax": current_tax,
-                "TotalPayment": total_pmt,
-                "CumulativePaid": cum_paid
-                + cum_recast,  # Add recast total to cumulative only when reporting
-                "Balance": balance,
-                "RecastAmount": recast_amount,
-                "CumulativeRecast": cum_recast,
-                "IsPaidOff": balance <= 0,
-                "SavingsBalance": savings,
-                "MonthlyInterest": interest,
-                "MonthlyTaxBenefit": monthly_tax_benefit,
-                "EffectivePayment": total_pmt - monthly_tax_benefit,
-            }
-        )
 
-    return pd.DataFrame(rows)
+@st.cache_data(max_entries=64)
+def schedule_files(scenario, months=None):
+    """(Parquet, Feather) bytes of a schedule, serialized once per scenario and horizon"""
+    schedule = schedule_table(*snapshot_store().schedules(scenario, months))
+    return to_parquet(schedule), to_feather(schedule)
 
 
-def simulate_no_recast(term_mo, r_mo, tax, ins):
-    balance = loan
-    p_i = payment(balance, term_mo, r_mo)
-    savings = initial_cash  # Start with initial cash
-    rows = []
-    cum_paid = 0
+# Inputs worth precomputing neighbours for, one widget step (INPUT_RANGES) away
+PREFETCH_INPUTS = (
+    "price",
+    "down",
+    "rate",
+    "tax_appreciation",
+    "ins_month",
+    "recast_int",
+    "initial_cash",
+    "surplus",
+    "buffer_cash",
+    "lump",
+)
 
-    for m in range(1, term_mo + 1):
-        # Calculate appreciated property tax for this month
-        current_tax = tax * (1 + tax_appreciation / 100) ** (m / 12)
 
-        interest = balance * r_mo if balance > 0 else 0
-        principal = p_i - interest if balance > 0 else 0
-        if balance > 0:
-            balance -= principal
-        total_pmt = (p_i if balance > 0 else 0) + current_tax + ins
+# Sidebar values held back by "Apply changes" mode (missing ones are None)
+DEFERRED_INPUTS = (
+    "price",
+    "down",
+    "loan",
+    "rate",
+    "term_years",
+    "term_mo",
+    "start_month",
+    "tax_method",
+    "tax_month",
+    "tax_pct",
+    "tax_appreciation",
+    "tax_escalation",
+    "tax_cap",
+    "ins_month",
+    "ins_inflation",
+    "method",
+    "recast_int",
+    "initial_cash",
+    "surplus",
+    "buffer_cash",
+    "lump",
+    "use_secondary",
+    "gross_income",
+    "manual_tax_rate1",
+    "tax_rate",
+    "gross_income2",
+    "manual_tax_rate2",
+    "tax_rate2",
+    "baseline_spend",
+)
 
-        # Still accumulate savings, but never use them for recasting
-        savings += surplus
 
-        cum_paid += total_pmt
+# Inputs are mirrored into short query params so a link reproduces the scenario.
+# The link is only read when a session starts; afterwards the widgets own the state.
+if "url_inputs" not in st.session_state:
+    st.session_state.url_inputs = st.query_params.to_dict()
 
-        rows.append(
-            {
-                "Month": m,
-                "TotalPayment": total_pmt,
-                "Tax": current_tax,
-                "CumulativePaid": cum_paid,
-                "Balance": balance,
-                "IsPaidOff": balance <= 0,
-                "SavingsBalance": savings,
-            }
-        )
 
-    return pd.DataFrame(rows)
-
-
-def calculate_tax_benefit(
-    yearly_interest, property_tax, income, filing_status="married"
-):
-    """Calculate tax benefit from mortgage interest and property tax deductions"""
-    # Constants for 2025
-    STANDARD_DEDUCTION = 29850 if filing_status == "married" else 14925
-    SALT_LIMIT = 10000
-    MORTGAGE_LIMIT = 750000
-
-    # Limit mortgage interest deduction based on loan balance
-    effective_ratio = min(MORTGAGE_LIMIT / loan, 1) if loan > 0 else 0
-    deductible_interest = yearly_interest * effective_ratio
-
-    # Calculate SALT (State And Local Tax) deduction
-    deductible_salt = min(property_tax * 12, SALT_LIMIT)  # Property tax is monthly
-
-    # Total itemized deductions
-    total_itemized = deductible_interest + deductible_salt
-
-    # Only beneficial if itemized > standard
-    if total_itemized <= STANDARD_DEDUCTION:
-        return 0
-
-    # Calculate marginal benefit on amount over standard deduction
-    excess_deduction = total_itemized - STANDARD_DEDUCTION
-
-    # Get marginal rates
-    if filing_status == "married":
-        if income <= 203300:
-            federal_marginal = 0.22
-        elif income <= 398400:
-            federal_marginal = 0.24
-        elif income <= 504550:
-            federal_marginal = 0.32
-        elif income <= 755100:
-            federal_marginal = 0.35
-        else:
-            federal_marginal = 0.37
-    else:  # single
-        if income <= 103350:
-            federal_marginal = 0.22
-        elif income <= 197300:
-            federal_marginal = 0.24
-        elif income <= 250525:
-            federal_marginal = 0.32
-        elif income <= 626350:
-            federal_marginal = 0.35
-        else:
-            federal_marginal = 0.37
-
-    # Get CA state marginal rate
-    if filing_status == "married":
-        if income <= 75576:
-            state_marginal = 0.04
-        elif income <= 104910:
-            state_marginal = 0.06
-        elif income <= 132590:
-            state_marginal = 0.08
-        elif income <= 677278:
-            state_marginal = 0.093
-        elif income <= 812728:
-            state_marginal = 0.103
-        elif income <= 1354550:
-            state_marginal = 0.113
-        else:
-            state_marginal = 0.123
-    else:  # single
-        if income <= 37788:
-            state_marginal = 0.04
-        elif income <= 52455:
-            state_marginal = 0.06
-        elif income <= 66295:
-            state_marginal = 0.08
-        elif income <= 338639:
-            state_marginal = 0.093
-        elif income <= 406364:
-            state_marginal = 0.103
-        elif income <= 677275:
-            state_marginal = 0.113
-        else:
-            state_marginal = 0.123
+def url_number(key, default, min_value, max_value):
+    """Initial widget value from a shared link, clamped to the widget's range"""
+    try:
+        value = float(st.session_state.url_inputs[key])
+    except (KeyError, ValueError):
+        return default
+    if not math.isfinite(value):
+        return default
+    return type(default)(min(max(value, min_value), max_value))
+
+
+def input_range(field, key, default, max_value=None):
+    """number_input() range and step of a scenario input, seeded from a shared link"""
+    low, high, step = INPUT_RANGES[field]
+    high = high if max_value is None else max_value
+    value = url_number(key, default, low, high)
+    return dict(min_value=low, max_value=high, value=value, step=step)
+
+
+def input_column(label, field, **kwargs):
+    """Data editor column limited to a scenario input's range"""
+    low, high, _ = INPUT_RANGES[field]
+    return st.column_config.NumberColumn(label, min_value=low, max_value=high, **kwargs)
+
 
-    # Combine rates and calculate tax benefit
-    combined_marginal = federal_marginal + state_marginal
-    tax_benefit = excess_deduction * combined_marginal
+def url_index(key, options, default=0):
+    """Initial radio index (or checkbox state) from a shared link"""
+    raw = st.session_state.url_inputs.get(key)
+    return int(raw) if raw in [str(i) for i in range(len(options))] else default
 
-    return tax_benefit
+
+def url_value(value):
+    return f"{value:g}" if isinstance(value, float) else str(int(value))
 
 
 # ---------------- Inputs ----------------
 st.title("Mortgage Payment Simulator")
+apply_mode = st.sidebar.toggle(
+    "Apply changes manually",
+    bool(url_index("am", (False, True))),
+    help="Hold back the simulation until you press Apply, instead of rerunning it on every edit. Captions such as the monthly property tax still update as you type.",
+)
+apply_slot = st.sidebar.container()
 st.sidebar.header("Mortgage details")
 
 price = st.sidebar.number_input(
-    "Purchase price ($)", 100_000, 10_000_000, 300000, step=25_000, format="%i"
+    "Purchase price ($)", format="%i", **input_range("price", "p", 300000)
 )
 down = st.sidebar.number_input(
-    "Down payment ($)", 0, price, int(price * 0.30), step=10_000, format="%i"
+    "Down payment ($)",
+    format="%i",
+    **input_range("down", "d", int(price * 0.30), max_value=price),
 )
 loan = price - down
 
 col1, col2 = st.sidebar.columns(2)
 with col1:
     rate = st.sidebar.number_input(
-        "Interest rate (%)", 0.1, 15.0, 6.6, step=0.05, format="%.2f"
+        "Interest rate (%)", format="%.2f", **input_range("rate", "r", 6.6)
     )
 with col2:
-    term_years = st.sidebar.number_input("Term (years)", 5, 40, 30, step=1)
+    term_years = st.sidebar.number_input(
+        "Term (years)", **input_range("term_years", "t", 30)
+    )
 
+month_names = tuple(calendar.month_name[1:])
+start_month = 1 + month_names.index(
+    st.sidebar.selectbox(
+        "First payment month",
+        month_names,
+        index=url_index("sm", month_names),
+        help="Deductions are totalled per calendar year, so this sets how the first and last tax years are split.",
+    )
+)
+
+tax_methods = ("Annual percentage", "Monthly amount")
 tax_method = st.sidebar.radio(
-    "Property tax input", ("Annual percentage", "Monthly amount"), horizontal=True
+    "Property tax input",
+    tax_methods,
+    index=url_index("tm", tax_methods),
+    horizontal=True,
 )
 if tax_method == "Monthly amount":
     tax_month = st.sidebar.number_input(
-        "Property tax ($/mo)", 0, 10_000, 1500, step=50, format="%i"
+        "Property tax ($/mo)", format="%i", **input_range("tax_month", "tx", 1500)
     )
 else:
     tax_pct = st.sidebar.number_input(
-        "Annual property tax (%)", 0.0, 5.0, 1.17, step=0.05, format="%.2f"
+        "Annual property tax (%)",
+        0.0,
+        5.0,
+        url_number("tp", 1.17, 0.0, 5.0),
+        step=0.05,
+        format="%.2f",
     )
     tax_month = int(price * (tax_pct / 100) / 12)
     st.sidebar.caption(f"Monthly property tax: ${tax_month:,}")
 
 tax_appreciation = st.sidebar.number_input(
-    "Annual property tax appreciation (%)", 0.0, 10.0, 2.0, step=0.1, format="%.1f"
+    "Annual property tax appreciation (%)",
+    format="%.1f",
+    **input_range("tax_appreciation", "ta", 2.0),
+)
+tax_escalation = st.sidebar.radio(
+    "Property tax increases",
+    TAX_ESCALATIONS,
+    index=url_index("te", TAX_ESCALATIONS),
+    horizontal=True,
+    help="Compound raises the tax a little every month. Annual reassessment raises it once a year, on the loan anniversary, by at most the cap (as under California's Proposition 13).",
 )
+tax_cap = DEFAULT_REASSESSMENT_CAP
+if tax_escalation == "Annual reassessment":
+    tax_cap = st.sidebar.number_input(
+        "Reassessment cap (%/yr)",
+        format="%.1f",
+        **input_range("tax_cap", "tc", DEFAULT_REASSESSMENT_CAP),
+    )
 
 ins_month = st.sidebar.number_input(
-    "Insurance ($/mo)", 0, 5_000, 300, step=25, format="%i"
+    "Insurance ($/mo)", format="%i", **input_range("ins_month", "i", 300)
+)
+ins_inflation = st.sidebar.number_input(
+    "Annual insurance increase (%)",
+    format="%.1f",
+    **input_range("ins_inflation", "ii", 0.0),
+    help="Premiums renew once a year, on the loan anniversary.",
 )
 
 st.sidebar.header("Recast strategy")
+methods = ["Savings-based", "Fixed lump sum"]
 method = st.sidebar.radio(
-    "Method", ["Savings-based", "Fixed lump sum"], horizontal=True
+    "Method", methods, index=url_index("m", methods), horizontal=True
+)
+recast_int = st.sidebar.number_input(
+    "Months between recasts", **input_range("recast_int", "ri", 12)
 )
-recast_int = st.sidebar.number_input("Months between recasts", 3, 60, 12, step=3)
 
 initial_cash = st.sidebar.number_input(
-    "Initial cash ($)", 0, 2_000_000, 0, step=10_000, format="%i"
+    "Initial cash ($)", format="%i", **input_range("initial_cash", "c", 0)
 )
 
 if method == "Savings-based":
     surplus = st.sidebar.number_input(
-        "Monthly savings ($)", 0, 50_000, 1_000, step=500, format="%i"
+        "Monthly savings ($)", format="%i", **input_range("surplus", "s", 1_000)
     )
     buffer_cash = st.sidebar.number_input(
-        "Cash buffer ($)", 0, 1_000_000, 10_000, step=10_000, format="%i"
+        "Cash buffer ($)", format="%i", **input_range("buffer_cash", "b", 10_000)
     )
     lump = 0
 else:
     lump = st.sidebar.number_input(
-        "Recast amount ($)", 0, 1_000_000, 90_000, step=10_000, format="%i"
+        "Recast amount ($)", format="%i", **input_range("lump", "l", 90_000)
     )
     surplus = 0
     buffer_cash = 0
 
 st.sidebar.header("Income scenarios (optional)")
+income_choices = ["Primary Income", "Secondary Income"]
 use_secondary = st.sidebar.radio(
     "Tax benefit calculation uses:",
-    ["Primary Income", "Secondary Income"],
+    income_choices,
+    index=url_index("u", income_choices),
     horizontal=True,
 )
 col1, col2 = st.sidebar.columns(2)
@@ -407,15 +286,20 @@ with col1:
     st.markdown("**Primary Income**")
     gross_income = st.number_input(
         "Primary gross annual income ($)",
-        0,
-        10_000_000,
-        200000,
-        step=10_000,
         format="%i",
+        **input_range("benefit_income", "g1", 200000),
+    )
+    manual_tax_rate1 = st.checkbox(
+        "Set tax rate manually (Primary)", bool(url_index("m1", (False, True)))
     )
-    manual_tax_rate1 = st.checkbox("Set tax rate manually (Primary)", False)
     if manual_tax_rate1:
-        tax_rate = st.slider("Primary tax rate (%)", 0.0, 60.0, 40.0, step=0.5)
+        tax_rate = st.slider(
+            "Primary tax rate (%)",
+            0.0,
+            60.0,
+            url_number("r1", 40.0, 0.0, 60.0),
+            step=0.5,
+        )
         st.write(f"**Effective rate: {tax_rate:.1f}%**")
     else:
         tax_rate = calculate_effective_tax_rate(gross_income)
@@ -458,15 +342,20 @@ with col2:
     st.markdown("**Secondary Income**")
     gross_income2 = st.number_input(
         "Secondary gross annual income ($)",
-        0,
-        10_000_000,
-        100000,
-        step=10_000,
         format="%i",
+        **input_range("benefit_income", "g2", 100000),
+    )
+    manual_tax_rate2 = st.checkbox(
+        "Set tax rate manually (Secondary)", bool(url_index("m2", (False, True)))
     )
-    manual_tax_rate2 = st.checkbox("Set tax rate manually (Secondary)", False)
     if manual_tax_rate2:
-        tax_rate2 = st.slider("Secondary tax rate (%)", 0.0, 60.0, 40.0, step=0.5)
+        tax_rate2 = st.slider(
+            "Secondary tax rate (%)",
+            0.0,
+            60.0,
+            url_number("r2", 40.0, 0.0, 60.0),
+            step=0.5,
+        )
         st.write(f"**Effective rate: {tax_rate2:.1f}%**")
     else:
         tax_rate2 = calculate_effective_tax_rate(gross_income2)
@@ -507,33 +396,273 @@ with col2:
         st.caption(f"CA State: {state_marginal2:.1f}%")
 
 baseline_spend = st.sidebar.number_input(
-    "Baseline non-housing spend ($/mo)", 0, 50_000, 0, step=500, format="%i"
+    "Baseline non-housing spend ($/mo)",
+    0,
+    50_000,
+    url_number("bs", 0, 0, 50_000),
+    step=500,
+    format="%i",
 )
 
 # Calculate term_mo before we need it
 term_mo = term_years * 12
 
 st.sidebar.header("Chart settings")
-max_months = st.sidebar.number_input("Time horizon (months)", 12, term_mo, 96, step=12)
+max_months = st.sidebar.number_input(
+    "Time horizon (months)", 12, term_mo, url_number("h", 96, 12, term_mo), step=12
+)
 
 include_tax_refund = st.sidebar.checkbox(
     "Include future tax refund in effective payment",
-    True,
+    bool(url_index("tr", (False, True), 1)),
     help="When checked, subtracts estimated tax benefits from the payment amount. Uncheck to see raw payment before tax benefits.",
 )
+browser_charts = st.sidebar.toggle(
+    "Browser-side chart controls",
+    bool(url_index("bc", (False, True))),
+    help="Send the full-term schedule to the browser once; the payment and cumulative charts then change horizon, tax refund and recast markers there without rerunning the app.",
+)
+
+st.sidebar.header("Affordability")
+solve_choices = ("Maximum price", "Minimum down payment")
+solve_for = st.sidebar.radio(
+    "Solve for", solve_choices, index=url_index("gs", solve_choices), horizontal=True
+)
+limit_choices = ("Front-end DTI", "Monthly payment")
+limit = st.sidebar.radio(
+    "Limit", limit_choices, index=url_index("gl", limit_choices), horizontal=True
+)
+if limit == "Front-end DTI":
+    target_dti = st.sidebar.number_input(
+        "Target front-end DTI (%)",
+        1.0,
+        100.0,
+        url_number("gd", 28.0, 1.0, 100.0),
+        step=1.0,
+        format="%.1f",
+        help="P&I, property tax and insurance as a share of combined gross income. 28% is the traditional limit; 36% the back-end limit including other debt.",
+    )
+    target_payment = (gross_income + gross_income2) / 12 * target_dti / 100
+    limit_label = f"{target_dti:g}% DTI"
+else:
+    target_payment = st.sidebar.number_input(
+        "Maximum monthly payment ($)",
+        0,
+        100_000,
+        url_number("gp", 5_000, 0, 100_000),
+        step=100,
+        format="%i",
+        help="Uses the effective payment when the tax refund is included above.",
+    )
+    limit_label = f"${target_payment:,}/mo"
+
+# Closed-form payments make this a millisecond bisection, so it runs on every rerun
+solution = goal_seek(
+    "price" if solve_for == "Maximum price" else "down",
+    target_payment,
+    price,
+    down,
+    rate=rate,
+    term_years=term_years,
+    tax_month=tax_month,
+    ins_month=ins_month,
+    tax_pct=tax_pct if tax_method == "Annual percentage" else None,
+    benefit_income=tax_benefit_income(use_secondary, gross_income, gross_income2),
+    effective=limit == "Monthly payment" and include_tax_refund,
+)
+if limit == "Front-end DTI" and target_payment <= 0:
+    st.sidebar.caption("Enter an income above to solve for a DTI target.")
+elif np.isnan(solution):
+    st.sidebar.caption(f"Taxes and insurance alone exceed {limit_label}.")
+elif solve_for == "Maximum price":
+    at_cap = " or more" if solution >= MAX_PRICE else ""
+    st.sidebar.markdown(
+        f"Maximum price at {limit_label} with ${down:,} down: **${solution:,.0f}**{at_cap}"
+    )
+else:
+    st.sidebar.markdown(
+        f"Minimum down payment at {limit_label} for a ${price:,} home: **${solution:,.0f}**"
+    )
+
+# In apply mode everything below (engine, charts, link) sees the last applied
+# mortgage, recast and income inputs; the widgets and their captions stay live.
+live_inputs = {name: globals().get(name) for name in DEFERRED_INPUTS}
+if apply_mode:
+    applied_inputs = st.session_state.setdefault("applied_inputs", live_inputs)
+    with apply_slot:
+        if st.button(
+            "Apply changes",
+            type="primary",
+            disabled=live_inputs == applied_inputs,
+            use_container_width=True,
+        ):
+            # Start over so the button and everything below see the new inputs
+            st.session_state.applied_inputs = live_inputs
+            st.rerun()
+        if live_inputs != applied_inputs:
+            st.caption("Edited inputs take effect when applied.")
+    globals().update(applied_inputs)
+else:
+    st.session_state.applied_inputs = live_inputs
+
+# Only the inputs that are currently in use go into the link
+share = {
+    "am": apply_mode,
+    "p": price,
+    "d": down,
+    "r": rate,
+    "t": term_years,
+    "sm": start_month - 1,
+    "tm": tax_methods.index(tax_method),
+    "ta": tax_appreciation,
+    "te": TAX_ESCALATIONS.index(tax_escalation),
+    "i": ins_month,
+    "ii": ins_inflation,
+    "m": methods.index(method),
+    "ri": recast_int,
+    "c": initial_cash,
+    "u": income_choices.index(use_secondary),
+    "g1": gross_income,
+    "m1": manual_tax_rate1,
+    "g2": gross_income2,
+    "m2": manual_tax_rate2,
+    "bs": baseline_spend,
+    "h": max_months,
+    "tr": include_tax_refund,
+    "bc": browser_charts,
+    "gs": solve_choices.index(solve_for),
+    "gl": limit_choices.index(limit),
+}
+if tax_method == "Monthly amount":
+    share["tx"] = tax_month
+else:
+    share["tp"] = tax_pct
+if tax_escalation == "Annual reassessment":
+    share["tc"] = tax_cap
+if method == "Savings-based":
+    share.update(s=surplus, b=buffer_cash)
+else:
+    share["l"] = lump
+if manual_tax_rate1:
+    share["r1"] = tax_rate
+if manual_tax_rate2:
+    share["r2"] = tax_rate2
+if limit == "Front-end DTI":
+    share["gd"] = target_dti
+else:
+    share["gp"] = target_payment
+share = {key: url_value(value) for key, value in share.items()}
+if st.query_params.to_dict() != share:
+    st.query_params.from_dict(share)
+st.sidebar.caption(
+    "The page URL always reflects these inputs; share it to reproduce them."
+)
 
 # ---------------- Simulation ----------------
-monthly_rate = rate / 100 / 12
-df = simulate(term_mo, monthly_rate, tax_month, ins_month)
-df_no_recast = simulate_no_recast(term_mo, monthly_rate, tax_month, ins_month)
+scenario_inputs = dict(
+    price=price,
+    down=down,
+    rate=rate,
+    term_years=term_years,
+    tax_month=tax_month,
+    ins_month=ins_month,
+    tax_appreciation=tax_appreciation,
+    method=method,
+    recast_int=recast_int,
+    initial_cash=initial_cash,
+    surplus=surplus,
+    buffer_cash=buffer_cash,
+    lump=lump,
+    benefit_income=tax_benefit_income(use_secondary, gross_income, gross_income2),
+    start_month=start_month,
+    tax_escalation=tax_escalation,
+    tax_cap=tax_cap,
+    ins_inflation=ins_inflation,
+)
+scenario = build_scenario(**scenario_inputs)
+# Shared links send bursts of identical scenarios; compute each one once.
+# Only the displayed horizon is simulated (the store is shared, so copy).
+df, df_no_recast = snapshot_store().schedules(scenario, max_months)
+df = df.copy()
+df_no_recast = df_no_recast.copy()
+
+# ---------------- Scenario comparison ----------------
+comparison_columns = {
+    "Name": st.column_config.TextColumn("Name"),
+    "Price": input_column("Price ($)", "price", step=25_000),
+    "Down": input_column("Down ($)", "down", step=10_000),
+    "Rate": input_column("Rate (%)", "rate"),
+    "Term": input_column("Term (years)", "term_years"),
+    "Method": st.column_config.SelectboxColumn("Method", options=methods),
+    "RecastInt": input_column("Recast every (mo)", "recast_int"),
+    "InitialCash": input_column("Initial cash ($)", "initial_cash"),
+    "Surplus": input_column("Monthly savings ($)", "surplus"),
+    "Buffer": input_column("Cash buffer ($)", "buffer_cash"),
+    "Lump": input_column("Recast amount ($)", "lump"),
+}
+with st.expander("Compare scenarios"):
+    st.caption(
+        "Add rows to simulate alternatives next to the sidebar inputs; blank cells "
+        "use the sidebar value. All scenarios run in one batched simulation and are "
+        "overlaid on the Monthly payment and Cumulative costs charts."
+    )
+    comparison_rows = st.data_editor(
+        pd.DataFrame(columns=list(comparison_columns)),
+        column_config=comparison_columns,
+        num_rows="dynamic",
+        hide_index=True,
+        key="comparison_editor",
+    )
 
-# Trim dataframes to max_months
-df = df[df["Month"] <= max_months].copy()
-df_no_recast = df_no_recast[df_no_recast["Month"] <= max_months].copy()
+comparison_names = ["Current inputs"]
+comparison_scenarios = [scenario]
+for i, row in comparison_rows.iterrows():
+    # Blank cells fall back to the sidebar inputs
+    row = row.where(row.notna(), None)
+    row_price = row["Price"] or price
+    try:
+        comparison_scenarios.append(
+            build_scenario(
+                row_price,
+                row["Down"] if row["Down"] is not None else down,
+                row["Rate"] or rate,
+                row["Term"] or term_years,
+                (
+                    tax_month
+                    if tax_method == "Monthly amount"
+                    else int(row_price * (tax_pct / 100) / 12)
+                ),
+                ins_month,
+                tax_appreciation=tax_appreciation,
+                method=row["Method"] or method,
+                recast_int=row["RecastInt"] or recast_int,
+                initial_cash=(
+                    row["InitialCash"]
+                    if row["InitialCash"] is not None
+                    else initial_cash
+                ),
+                surplus=row["Surplus"] if row["Surplus"] is not None else surplus,
+                buffer_cash=row["Buffer"] if row["Buffer"] is not None else buffer_cash,
+                lump=row["Lump"] if row["Lump"] is not None else lump,
+                benefit_income=scenario["benefit_income"],
+                start_month=start_month,
+                tax_escalation=tax_escalation,
+                tax_cap=tax_cap,
+                ins_inflation=ins_inflation,
+            )
+        )
+    except ValueError as e:
+        st.warning(f"Skipping comparison row {i + 1}: {e}")
+        continue
+    comparison_names.append(row["Name"] or f"Scenario {len(comparison_names) + 1}")
+
+if len(comparison_scenarios) > 1:
+    df_compare, df_compare_no_recast = simulate_batch(
+        comparison_scenarios, months=max_months
+    )
 
 # ---------------- Charts ----------------
 st.subheader("Monthly payment")
-recast_points = df[df["RecastAmount"] > 0].copy()
 
 # Define a modern dark color palette
 colors = {
@@ -603,214 +732,746 @@ plot_template = dict(
         ),
     )
 )
-# Also add initial payment point
-initial_point = pd.DataFrame(
-    {
-        "Month": [0],
-        "TotalPayment": [df["TotalPayment"].iloc[0]],
-        "EffectivePayment": [df["EffectivePayment"].iloc[0]],
-        "RecastAmount": [0],
-        "P&I": [df["P&I"].iloc[0]],
-    }
-)
+# The Plotly figures are only built when the browser is not drawing the charts
+if not browser_charts:
+    recast_points = df[df["RecastAmount"] > 0].copy()
+
+    # Also add initial payment point
+    initial_point = pd.DataFrame(
+        {
+            "Month": [0],
+            "TotalPayment": [df["TotalPayment"].iloc[0]],
+            "EffectivePayment": [df["EffectivePayment"].iloc[0]],
+            "RecastAmount": [0],
+            "P&I": [df["P&I"].iloc[0]],
+        }
+    )
 
-if len(recast_points) > 0:
-    # For each recast point, create a copy of the next row to show payment after recast
-    next_points = recast_points.copy()
-    next_points["Month"] = next_points["Month"] + 1
-
-    # Get payment values from after each recast
-    for idx in next_points.index:
-        month = next_points.loc[idx, "Month"]
-        if month < len(df):
-            next_points.loc[idx, "TotalPayment"] = df.loc[
-                df["Month"] == month, "TotalPayment"
-            ].values[0]
-            next_points.loc[idx, "EffectivePayment"] = df.loc[
-                df["Month"] == month, "EffectivePayment"
-            ].values[0]
-else:
-    next_points = initial_point
+    if len(recast_points) > 0:
+        # For each recast point, create a copy of the next row to show payment after recast
+        next_points = recast_points.copy()
+        next_points["Month"] = next_points["Month"] + 1
+
+        # Get payment values from after each recast
+        for idx in next_points.index:
+            month = next_points.loc[idx, "Month"]
+            if month < len(df):
+                next_points.loc[idx, "TotalPayment"] = df.loc[
+                    df["Month"] == month, "TotalPayment"
+                ].values[0]
+                next_points.loc[idx, "EffectivePayment"] = df.loc[
+                    df["Month"] == month, "EffectivePayment"
+                ].values[0]
+    else:
+        next_points = initial_point
+
+    next_points = pd.concat([initial_point, next_points], ignore_index=True)
 
-next_points = pd.concat([initial_point, next_points], ignore_index=True)
+    # Create monthly payments figure
+    fig1 = go.Figure()
 
-# Create monthly payments figure
-fig1 = go.Figure()
+    # Monthly payment lines - Effective Payment first so it's the primary line
+    # Use either effective payment (with tax benefit) or total payment as the primary line based on toggle
+    if include_tax_refund:
+        fig1.add_trace(
+            go.Scatter(
+                x=df["Month"],
+                y=df["EffectivePayment"],
+                name="Effective Payment",
+                line=dict(color=colors["highlight"], width=3),
+            )
+        )
+        fig1.add_trace(
+            go.Scatter(
+                x=df["Month"],
+                y=df["TotalPayment"],
+                name="Total Payment",
+                line=dict(color=colors["primary"], width=2, dash="dot"),
+            )
+        )
+    else:
+        fig1.add_trace(
+            go.Scatter(
+                x=df["Month"],
+                y=df["TotalPayment"],
+                name="Total Payment",
+                line=dict(color=colors["highlight"], width=3),
+            )
+        )
+        fig1.add_trace(
+            go.Scatter(
+                x=df["Month"],
+                y=df["EffectivePayment"],
+                name="Effective Payment",
+                line=dict(color=colors["primary"], width=2, dash="dot"),
+            )
+        )
 
-# Monthly payment lines - Effective Payment first so it's the primary line
-# Use either effective payment (with tax benefit) or total payment as the primary line based on toggle
-if include_tax_refund:
     fig1.add_trace(
         go.Scatter(
             x=df["Month"],
-            y=df["EffectivePayment"],
-            name="Effective Payment",
-            line=dict(color=colors["highlight"], width=3),
+            y=df["P&I"],
+            name="P&I",
+            line=dict(color=colors["accent1"], width=2),
         )
     )
+
     fig1.add_trace(
         go.Scatter(
             x=df["Month"],
-            y=df["TotalPayment"],
-            name="Total Payment",
-            line=dict(color=colors["primary"], width=2, dash="dot"),
+            y=df["Tax"],
+            name="Tax",
+            line=dict(color=colors["accent2"], width=2),
         )
     )
-else:
+
     fig1.add_trace(
         go.Scatter(
             x=df["Month"],
-            y=df["TotalPayment"],
-            name="Total Payment",
-            line=dict(color=colors["highlight"], width=3),
+            y=df["MonthlyTaxBenefit"],
+            name="Tax Benefit",
+            line=dict(color=colors["secondary"], width=2, dash="dot"),
         )
     )
+
+    # Add recast indicators
     fig1.add_trace(
         go.Scatter(
-            x=df["Month"],
-            y=df["EffectivePayment"],
-            name="Effective Payment",
-            line=dict(color=colors["primary"], width=2, dash="dot"),
+            x=next_points["Month"],
+            y=(
+                next_points["EffectivePayment"]
+                if include_tax_refund
+                else next_points["TotalPayment"]
+            ),
+            mode="markers+text",
+            marker=dict(symbol="star", size=12, color=colors["highlight"]),
+            text=[
+                f"${y:,.0f}"
+                for y in (
+                    next_points["EffectivePayment"]
+                    if include_tax_refund
+                    else next_points["TotalPayment"]
+                )
+            ],
+            textposition="top center",
+            name="Payment after Recast",
+            customdata=next_points["TotalPayment"],
+            hovertemplate="Month: %{x}<br>"
+            + ("Effective" if include_tax_refund else "Total")
+            + " Payment: $%{y:,.2f}<br>Total Payment: $%{customdata:,.2f}",
         )
     )
 
-fig1.add_trace(
-    go.Scatter(
-        x=df["Month"],
-        y=df["P&I"],
-        name="P&I",
-        line=dict(color=colors["accent1"], width=2),
+    # Update monthly payments figure layout
+    fig1.update_layout(
+        template=plot_template,
+        height=500,
+        title=dict(
+            text="Monthly Payments & Tax Benefits",
+            x=0.5,
+            font=dict(size=20, color=colors["primary"]),
+        ),
+        showlegend=True,
+        legend=dict(
+            yanchor="bottom",
+            y=1.04,
+            xanchor="center",
+            x=0.35,
+            orientation="h",
+            title=dict(
+                text="Monthly Payments", font=dict(size=12, color=colors["primary"])
+            ),
+            font=dict(color=colors["primary"]),
+        ),
+        yaxis_title=dict(text="Monthly Payment ($)", font=dict(size=14)),
+        xaxis_title=dict(text="Month", font=dict(size=14)),
+        margin=dict(t=150),  # Add more top margin for the legend
     )
-)
 
-fig1.add_trace(
-    go.Scatter(
-        x=df["Month"],
-        y=df["Tax"],
-        name="Tax",
-        line=dict(color=colors["accent2"], width=2),
+    if len(comparison_scenarios) > 1:
+        comparison_colors = [
+            colors["secondary"],
+            colors["accent2"],
+            colors["accent1"],
+            colors["primary"],
+        ]
+        payment_column = "EffectivePayment" if include_tax_refund else "TotalPayment"
+        for k, name in enumerate(comparison_names[1:], start=1):
+            rows = df_compare[df_compare["Scenario"] == k]
+            fig1.add_trace(
+                go.Scatter(
+                    x=rows["Month"],
+                    y=rows[payment_column],
+                    name=name,
+                    legendgroup="Comparison",
+                    line=dict(
+                        color=comparison_colors[(k - 1) % len(comparison_colors)],
+                        width=2,
+                        dash="dash",
+                    ),
+                )
+            )
+
+if browser_charts:
+    # Full term once; view-only changes are then handled in the browser
+    overlays = []
+    if len(comparison_scenarios) > 1:
+        full_compare = snapshot_store().schedules_many(comparison_scenarios[1:])
+        overlays = [
+            (name, frames[0])
+            for name, frames in zip(comparison_names[1:], full_compare)
+        ]
+    schedule_chart(
+        schedule_payload(*snapshot_store().schedules(scenario), overlays),
+        max_months,
+        include_tax_refund,
+        colors,
+        key="schedule_chart",
     )
-)
+else:
+    st.plotly_chart(fig1)
+    st.subheader("Cumulative costs")
 
-fig1.add_trace(
-    go.Scatter(
-        x=df["Month"],
-        y=df["MonthlyTaxBenefit"],
-        name="Tax Benefit",
-        line=dict(color=colors["secondary"], width=2, dash="dot"),
+    # Create cumulative costs figure
+    fig2 = go.Figure()
+
+    fig2.add_trace(
+        go.Scatter(
+            x=df["Month"],
+            y=df["CumulativePaid"],
+            name="Cumulative Cost (with recast)",
+            line=dict(color=colors["highlight"], width=3),
+        )
     )
-)
 
-# Add recast indicators
-fig1.add_trace(
-    go.Scatter(
-        x=next_points["Month"],
-        y=(
-            next_points["EffectivePayment"]
-            if include_tax_refund
-            else next_points["TotalPayment"]
-        ),
-        mode="markers+text",
-        marker=dict(symbol="star", size=12, color=colors["highlight"]),
-        text=[
-            f"${y:,.0f}"
-            for y in (
-                next_points["EffectivePayment"]
-                if include_tax_refund
-                else next_points["TotalPayment"]
-            )
-        ],
-        textposition="top center",
-        name="Payment after Recast",
-        customdata=next_points["TotalPayment"],
-        hovertemplate="Month: %{x}<br>"
-        + ("Effective" if include_tax_refund else "Total")
-        + " Payment: $%{y:,.2f}<br>Total Payment: $%{customdata:,.2f}",
+    fig2.add_trace(
+        go.Scatter(
+            x=df_no_recast["Month"],
+            y=df_no_recast["CumulativePaid"],
+            name="Cumulative Cost (no recast)",
+            line=dict(color=colors["primary"], width=2, dash="dot"),
+        )
     )
-)
 
-# Update monthly payments figure layout
-fig1.update_layout(
-    template=plot_template,
-    height=500,
-    title=dict(
-        text="Monthly Payments & Tax Benefits",
-        x=0.5,
-        font=dict(size=20, color=colors["primary"]),
-    ),
-    showlegend=True,
-    legend=dict(
-        yanchor="bottom",
-        y=1.04,
-        xanchor="center",
-        x=0.35,
-        orientation="h",
-        title=dict(
-            text="Monthly Payments", font=dict(size=12, color=colors["primary"])
+    fig2.add_trace(
+        go.Scatter(
+            x=df["Month"],
+            y=df["Balance"],
+            name="Loan Balance",
+            line=dict(color=colors["accent1"], width=2),
+        )
+    )
+
+    # Update cumulative costs figure layout
+    fig2.update_layout(
+        template=plot_template,
+        height=500,
+        title=dict(text="Cumulative Cost & Balance", x=0.5, font=dict(size=20)),
+        showlegend=True,
+        legend=dict(
+            yanchor="bottom",
+            y=1.02,
+            xanchor="left",
+            x=0.01,
+            orientation="h",
+            title=dict(
+                text="Cumulative Analysis", font=dict(size=12, color=colors["primary"])
+            ),
+            font=dict(color=colors["primary"]),
         ),
-        font=dict(color=colors["primary"]),
+        yaxis_title=dict(text="Amount ($)", font=dict(size=14)),
+        xaxis_title=dict(text="Month", font=dict(size=14)),
+        margin=dict(t=100),  # Add more top margin for the legend
+    )
+
+    if len(comparison_scenarios) > 1:
+        for k, name in enumerate(comparison_names[1:], start=1):
+            rows = df_compare[df_compare["Scenario"] == k]
+            fig2.add_trace(
+                go.Scatter(
+                    x=rows["Month"],
+                    y=rows["CumulativePaid"],
+                    name=f"Cumulative Cost ({name})",
+                    line=dict(
+                        color=comparison_colors[(k - 1) % len(comparison_colors)],
+                        width=2,
+                        dash="dash",
+                    ),
+                )
+            )
+
+    st.plotly_chart(fig2)
+
+if len(comparison_scenarios) > 1:
+    st.subheader("Scenario comparison")
+    grouped = df_compare.groupby("Scenario")
+    grouped_no_recast = df_compare_no_recast.groupby("Scenario")
+    comparison_table = pd.DataFrame(
+        {
+            "Scenario": comparison_names,
+            "Loan": [s["loan"] for s in comparison_scenarios],
+            "First payment": grouped["TotalPayment"].first(),
+            "Last payment": grouped["TotalPayment"].last(),
+            "Total payments": grouped["TotalPayment"].sum(),
+            "Tax benefit": grouped["MonthlyTaxBenefit"].sum(),
+            "Total recast": grouped["RecastAmount"].sum(),
+            "Cumulative cost": grouped["CumulativePaid"].last(),
+            "Cumulative cost (no recast)": grouped_no_recast["CumulativePaid"].last(),
+            "Ending balance": grouped["Balance"].last(),
+        }
+    )
+    st.dataframe(
+        comparison_table,
+        hide_index=True,
+        column_config={
+            col: st.column_config.NumberColumn(format="$%.0f")
+            for col in comparison_table.columns[1:]
+        },
+    )
+    st.caption(f"Totals over the first {max_months} months.")
+
+# ---------------- Rate changes ----------------
+rate_event_columns = {
+    "Month": st.column_config.NumberColumn("From month", min_value=2, step=1),
+    "Kind": st.column_config.SelectboxColumn("Kind", options=RATE_EVENT_KINDS),
+    "Rate": st.column_config.NumberColumn("Rate (%)", min_value=0.1, max_value=20.0),
+    "Term": st.column_config.NumberColumn(
+        "New term (years)", min_value=1, max_value=40, help="Refinance only"
     ),
-    yaxis_title=dict(text="Monthly Payment ($)", font=dict(size=14)),
-    xaxis_title=dict(text="Month", font=dict(size=14)),
-    margin=dict(t=150),  # Add more top margin for the legend
-)
+    "ClosingCosts": st.column_config.NumberColumn("Closing costs ($)", min_value=0),
+}
+with st.expander("Adjustable rate and refinancing"):
+    st.caption(
+        "Add rate resets (e.g. an ARM after its fixed period) or refinances to the loan "
+        "without recasting. A refinance without a new term keeps the remaining term; "
+        "resets are limited by the caps below."
+    )
+    rate_rows = st.data_editor(
+        pd.DataFrame(columns=list(rate_event_columns)),
+        column_config=rate_event_columns,
+        num_rows="dynamic",
+        hide_index=True,
+        key="rate_event_editor",
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        periodic_cap = st.number_input(
+            "Periodic cap (points)", 0.0, 10.0, 2.0, step=0.25
+        )
+    with col2:
+        lifetime_cap = st.number_input(
+            "Lifetime cap (points)", 0.0, 20.0, 5.0, step=0.25
+        )
 
-st.plotly_chart(fig1)
+    rate_events = []
+    for _, row in rate_rows.iterrows():
+        row = row.where(row.notna(), None)
+        if row["Month"] is None or row["Rate"] is None:
+            continue
+        event = {
+            "month": int(row["Month"]),
+            "rate": float(row["Rate"]),
+            "kind": row["Kind"] or "Reset",
+            "closing_costs": row["ClosingCosts"] or 0,
+        }
+        if row["Term"]:
+            event["term_mo"] = int(row["Term"]) * 12
+        rate_events.append(event)
+
+    # Path 0 keeps the fixed rate; path 1 applies the events
+    try:
+        rate_paths = rate_path_arrays([[], rate_events])
+    except ValueError as e:
+        st.warning(f"Ignoring rate changes: {e}")
+        rate_paths = rate_path_arrays([[], []])
+    segments = amortize_segments(
+        loan, rate, term_mo, rate_paths, caps=(periodic_cap, lifetime_cap)
+    )
+    rate_schedule = segment_schedule(segments, int(segments["End"].max()))
+
+    fig_rates = go.Figure()
+    for path, name, color in (
+        (0, "Fixed rate", colors["accent1"]),
+        (1, "With rate changes", colors["secondary"]),
+    ):
+        fig_rates.add_trace(
+            go.Scatter(
+                x=np.arange(1, rate_schedule["P&I"].shape[1] + 1),
+                y=rate_schedule["P&I"][path],
+                name=name,
+                line=dict(color=color, width=3 if path else 2),
+            )
+        )
+    fig_rates.update_layout(
+        template=plot_template,
+        height=400,
+        title=dict(text="P&I With Rate Changes", x=0.5, font=dict(size=20)),
+        yaxis_title=dict(text="Monthly P&I ($)", font=dict(size=14)),
+        xaxis_title=dict(text="Month", font=dict(size=14)),
+    )
+    st.plotly_chart(fig_rates)
 
-st.subheader("Cumulative costs")
-# Create cumulative costs figure
-fig2 = go.Figure()
+    fixed_interest, changed_interest = rate_schedule["Interest"].sum(axis=1)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(
+            "Total interest",
+            f"${changed_interest:,.0f}",
+            f"${changed_interest - fixed_interest:,.0f} vs fixed",
+            delta_color="inverse",
+        )
+    with col2:
+        st.metric("Closing costs", f"${rate_schedule['ClosingCosts'][1].sum():,.0f}")
+    with col3:
+        st.metric("Paid off in month", f"{segments['End'][1]:,.0f}")
 
-fig2.add_trace(
-    go.Scatter(
-        x=df["Month"],
-        y=df["CumulativePaid"],
-        name="Cumulative Cost (with recast)",
-        line=dict(color=colors["highlight"], width=3),
+    st.markdown("**Refinance break-even**")
+    col1, col2 = st.columns(2)
+    with col1:
+        refi_month = st.number_input(
+            "Refinance in month", 2, term_mo - 1, min(24, term_mo - 1), step=1
+        )
+    with col2:
+        refi_years = st.number_input(
+            "New term (years)", 0, 40, 0, step=5, help="0 keeps the remaining term"
+        )
+    # Every new rate x closing cost combination in one vectorized sweep
+    new_rates = np.arange(max(rate - 3, 0.25), rate + 1e-9, 0.25).round(2)
+    closing_grid = np.arange(0, 20_001, 2_500)
+    break_even = refinance_break_even(
+        loan,
+        rate,
+        term_mo,
+        refi_month,
+        new_rates[:, None],
+        closing_grid[None, :],
+        new_term_mo=refi_years * 12 or None,
+    )
+    fig_break_even = go.Figure(
+        go.Heatmap(
+            z=break_even,
+            x=[f"${c:,}" for c in closing_grid],
+            y=[f"{r:.2f}%" for r in new_rates],
+            colorscale="Viridis",
+            colorbar=dict(title="Months"),
+            hovertemplate="New rate %{y}, closing costs %{x}: %{z:.0f} months<extra></extra>",
+        )
+    )
+    fig_break_even.update_layout(
+        template=plot_template,
+        height=450,
+        xaxis_title=dict(text="Closing costs", font=dict(size=14)),
+        yaxis_title=dict(text="New rate", font=dict(size=14)),
     )
+    st.plotly_chart(fig_break_even)
+    st.caption(
+        "Months after refinancing until the interest saved covers the closing costs; "
+        "blank cells never break even."
+    )
+
+# ---------------- Rent vs buy ----------------
+st.subheader("Rent vs buy")
+col1, col2, col3 = st.columns(3)
+with col1:
+    # Seeded once from the price; a default computed from another input would
+    # give the widget a new identity, discarding the rent typed, on every change
+    st.session_state.setdefault("rent", int(round(price * 0.004, -2)))
+    rent = st.number_input("Monthly rent ($)", 0, 100_000, step=100, key="rent")
+    rent_growth = st.number_input("Annual rent growth (%)", 0.0, 15.0, 3.0, step=0.5)
+with col2:
+    home_appreciation = st.number_input(
+        "Annual home appreciation (%)", -10.0, 15.0, 3.0, step=0.5
+    )
+    selling_costs = st.number_input(
+        "Selling costs (% of value)", 0.0, 15.0, 6.0, step=0.5
+    )
+with col3:
+    investment_return = st.number_input(
+        "Annual investment return (%)", -10.0, 20.0, 7.0, step=0.5
+    )
+    return_volatility = st.number_input(
+        "Return volatility (%)",
+        0.0,
+        50.0,
+        15.0,
+        step=1.0,
+        help="0 earns the fixed return every month; otherwise 500 return paths are sampled.",
+    )
+
+# All return paths are solved in one vectorized pass over the displayed schedule
+return_paths = sample_return_paths(
+    investment_return, return_volatility, max_months, 500 if return_volatility else 1
+)
+rvb = rent_vs_buy(
+    df,
+    price,
+    down,
+    rent,
+    return_paths,
+    initial_cash=initial_cash,
+    home_appreciation=home_appreciation,
+    rent_growth=rent_growth,
+    selling_costs=selling_costs,
+    payment_column="EffectivePayment" if include_tax_refund else "TotalPayment",
+)
+renter_low, renter_median, renter_high = np.percentile(
+    rvb["rent"], [10, 50, 90], axis=0
 )
 
-fig2.add_trace(
+fig_rvb = go.Figure()
+if return_volatility:
+    fig_rvb.add_trace(
+        go.Scatter(x=df["Month"], y=renter_high, line=dict(width=0), showlegend=False)
+    )
+    fig_rvb.add_trace(
+        go.Scatter(
+            x=df["Month"],
+            y=renter_low,
+            fill="tonexty",
+            fillcolor="rgba(136, 192, 208, 0.25)",
+            line=dict(width=0),
+            name="Rent & invest (10th-90th percentile)",
+        )
+    )
+fig_rvb.add_trace(
     go.Scatter(
-        x=df_no_recast["Month"],
-        y=df_no_recast["CumulativePaid"],
-        name="Cumulative Cost (no recast)",
-        line=dict(color=colors["primary"], width=2, dash="dot"),
+        x=df["Month"],
+        y=renter_median,
+        name="Rent & invest" + (" (median)" if return_volatility else ""),
+        line=dict(color=colors["secondary"], width=3),
     )
 )
-
-fig2.add_trace(
+fig_rvb.add_trace(
     go.Scatter(
         x=df["Month"],
-        y=df["Balance"],
-        name="Loan Balance",
-        line=dict(color=colors["accent1"], width=2),
+        y=rvb["buy"],
+        name="Buy",
+        line=dict(color=colors["highlight"], width=3),
     )
 )
-
-# Update cumulative costs figure layout
-fig2.update_layout(
+# Paths still behind at the horizon count as later than any month shown
+break_even = np.median(np.nan_to_num(rvb["break_even"], nan=np.inf))
+if np.isfinite(break_even):
+    fig_rvb.add_vline(x=break_even, line=dict(color=colors["accent1"], dash="dot"))
+fig_rvb.update_layout(
     template=plot_template,
     height=500,
-    title=dict(text="Cumulative Cost & Balance", x=0.5, font=dict(size=20)),
-    showlegend=True,
-    legend=dict(
-        yanchor="bottom",
-        y=1.02,
-        xanchor="left",
-        x=0.01,
-        orientation="h",
-        title=dict(
-            text="Cumulative Analysis", font=dict(size=12, color=colors["primary"])
-        ),
-        font=dict(color=colors["primary"]),
-    ),
-    yaxis_title=dict(text="Amount ($)", font=dict(size=14)),
+    title=dict(text="Net Worth: Rent vs Buy", x=0.5, font=dict(size=20)),
+    yaxis_title=dict(text="Net worth ($)", font=dict(size=14)),
     xaxis_title=dict(text="Month", font=dict(size=14)),
-    margin=dict(t=100),  # Add more top margin for the legend
+    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="left", x=0.01),
+    margin=dict(t=100),
 )
+st.plotly_chart(fig_rvb)
 
-st.plotly_chart(fig2)
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric(
+        "Break-even month",
+        f"{break_even:.0f}" if np.isfinite(break_even) else f"> {max_months}",
+    )
+with col2:
+    st.metric(
+        f"Buying ahead at month {max_months}",
+        f"{(rvb['buy'][-1] >= rvb['rent'][:, -1]).mean():.0%}",
+    )
+with col3:
+    st.metric(
+        "Buy minus rent net worth",
+        f"${rvb['buy'][-1] - renter_median[-1]:,.0f}",
+    )
+st.caption(
+    "Buying: home value after selling costs, minus the loan balance, plus savings "
+    "(which earn nothing, as in the schedule). Renting: the down payment and initial "
+    "cash are invested, and each month whatever the buyer spends on housing and "
+    "savings beyond the rent is invested too."
+)
+
+# ---------------- Portfolio ----------------
+portfolio_columns = {
+    "Name": st.column_config.TextColumn("Name"),
+    "Price": input_column("Price ($)", "price", step=25_000),
+    "Down": input_column("Down ($)", "down", step=10_000),
+    "Rate": input_column("Rate (%)", "rate"),
+    "Term": input_column("Term (years)", "term_years"),
+    "Tax": input_column("Property tax ($/mo)", "tax_month"),
+    "Insurance": input_column("Insurance ($/mo)", "ins_month"),
+    "Method": st.column_config.SelectboxColumn("Method", options=methods),
+    "RecastInt": input_column("Recast every (mo)", "recast_int"),
+    "Lump": input_column("Recast amount ($)", "lump"),
+}
+with st.expander("Portfolio of properties"):
+    st.caption(
+        "Add further properties to simulate them together with the sidebar property, "
+        "recast from one shared savings pool. Blank cells use the sidebar value; each "
+        "property keeps its own recast method, interval and amount."
+    )
+    portfolio_rows = st.data_editor(
+        pd.DataFrame(columns=list(portfolio_columns)),
+        column_config=portfolio_columns,
+        num_rows="dynamic",
+        hide_index=True,
+        key="portfolio_editor",
+    )
+    # Seeded once from the sidebar, then kept as typed (see the rent input)
+    st.session_state.setdefault("pool_cash", initial_cash)
+    st.session_state.setdefault("pool_surplus", surplus)
+    st.session_state.setdefault("pool_buffer", buffer_cash)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        pool_cash = st.number_input(
+            "Pool initial cash ($)", 0, 10_000_000, step=10_000, key="pool_cash"
+        )
+    with col2:
+        pool_surplus = st.number_input(
+            "Pool monthly savings ($)", 0, 200_000, step=500, key="pool_surplus"
+        )
+    with col3:
+        pool_buffer = st.number_input(
+            "Pool cash buffer ($)", 0, 10_000_000, step=10_000, key="pool_buffer"
+        )
+    with col4:
+        pool_priority = st.selectbox(
+            "Recast first",
+            PORTFOLIO_PRIORITIES,
+            help="Order in which the pool funds loans due for a recast in the same month.",
+        )
+
+    portfolio_names = ["Current inputs"]
+    portfolio_scenarios = [scenario]
+    for i, row in portfolio_rows.iterrows():
+        row = row.where(row.notna(), None)
+        row_price = row["Price"] or price
+        try:
+            portfolio_scenarios.append(
+                build_scenario(
+                    row_price,
+                    row["Down"] if row["Down"] is not None else down,
+                    row["Rate"] or rate,
+                    row["Term"] or term_years,
+                    (
+                        row["Tax"]
+                        if row["Tax"] is not None
+                        else (
+                            tax_month
+                            if tax_method == "Monthly amount"
+                            else int(row_price * (tax_pct / 100) / 12)
+                        )
+                    ),
+                    row["Insurance"] if row["Insurance"] is not None else ins_month,
+                    tax_appreciation=tax_appreciation,
+                    method=row["Method"] or method,
+                    recast_int=row["RecastInt"] or recast_int,
+                    lump=row["Lump"] if row["Lump"] is not None else lump,
+                    tax_escalation=tax_escalation,
+                    tax_cap=tax_cap,
+                    ins_inflation=ins_inflation,
+                )
+            )
+        except ValueError as e:
+            st.warning(f"Skipping property {i + 1}: {e}")
+            continue
+        portfolio_names.append(row["Name"] or f"Property {len(portfolio_names) + 1}")
+
+    if len(portfolio_scenarios) > 1:
+        portfolio_loans, portfolio_totals = simulate_portfolio(
+            portfolio_scenarios,
+            initial_cash=pool_cash,
+            surplus=pool_surplus,
+            buffer_cash=pool_buffer,
+            priority=pool_priority,
+            months=max_months,
+        )
+        by_property = portfolio_loans.groupby("Property")
+        property_colors = [
+            colors["secondary"],
+            colors["accent2"],
+            colors["accent1"],
+            colors["highlight"],
+            colors["primary"],
+        ]
+
+        fig_cash = go.Figure()
+        fig_balance = go.Figure()
+        for k, rows in by_property:
+            color = property_colors[k % len(property_colors)]
+            fig_cash.add_trace(
+                go.Scatter(
+                    x=rows["Month"],
+                    y=rows["TotalPayment"],
+                    name=portfolio_names[k],
+                    stackgroup="payments",
+                    line=dict(color=color, width=1),
+                )
+            )
+            fig_balance.add_trace(
+                go.Scatter(
+                    x=rows["Month"],
+                    y=rows["Balance"],
+                    name=portfolio_names[k],
+                    stackgroup="balances",
+                    line=dict(color=color, width=1),
+                )
+            )
+        fig_cash.add_trace(
+            go.Bar(
+                x=portfolio_totals["Month"],
+                y=portfolio_totals["RecastAmount"],
+                name="Recasts",
+                marker_color=colors["grid"],
+                opacity=0.6,
+                yaxis="y2",
+            )
+        )
+        fig_balance.add_trace(
+            go.Scatter(
+                x=portfolio_totals["Month"],
+                y=portfolio_totals["SavingsBalance"],
+                name="Savings pool",
+                line=dict(color=colors["primary"], width=2, dash="dash"),
+            )
+        )
+        fig_cash.update_layout(
+            template=plot_template,
+            height=450,
+            title=dict(text="Portfolio Monthly Payments", x=0.5, font=dict(size=20)),
+            yaxis_title=dict(text="Monthly payment ($)", font=dict(size=14)),
+            yaxis2=dict(
+                title="Recast amount ($)", overlaying="y", side="right", showgrid=False
+            ),
+            xaxis_title=dict(text="Month", font=dict(size=14)),
+        )
+        fig_balance.update_layout(
+            template=plot_template,
+            height=450,
+            title=dict(text="Portfolio Balances", x=0.5, font=dict(size=20)),
+            yaxis_title=dict(text="Balance ($)", font=dict(size=14)),
+            xaxis_title=dict(text="Month", font=dict(size=14)),
+        )
+        st.plotly_chart(fig_cash)
+        st.plotly_chart(fig_balance)
+
+        portfolio_table = pd.DataFrame(
+            {
+                "Property": portfolio_names,
+                "Loan": [s["loan"] for s in portfolio_scenarios],
+                "Total payments": by_property["TotalPayment"].sum(),
+                "Total recast": by_property["RecastAmount"].sum(),
+                "Ending balance": by_property["Balance"].last(),
+            }
+        )
+        st.dataframe(
+            portfolio_table,
+            hide_index=True,
+            column_config={
+                col: st.column_config.NumberColumn(format="$%.0f")
+                for col in portfolio_table.columns[1:]
+            },
+        )
+        st.caption(
+            f"Totals over the first {max_months} months; the savings pool ends at "
+            f"${portfolio_totals['SavingsBalance'].iloc[-1]:,.0f}."
+        )
 
 # ---------------- Income Ratio Plot ----------------
 if gross_income > 0 or gross_income2 > 0:
@@ -1114,3 +1775,76 @@ if gross_income > 0 or gross_income2 > 0:
             (df["P&I"].iloc[0] + tax_month + ins_month) / gross_monthly * 100
         )
         st.metric("Front-end DTI", f"{front_end_dti:.1f}%")
+
+# ---------------- Export ----------------
+st.subheader("Export schedule")
+st.caption(
+    "Monthly schedule with and without recasting (NoRecast* columns), "
+    "for pandas, polars, DuckDB or Excel power query."
+)
+full_term = st.checkbox("Export the full term instead of the time horizon", False)
+parquet_bytes, feather_bytes = schedule_files(
+    scenario, None if full_term else max_months
+)
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button(
+        "Download Parquet",
+        parquet_bytes,
+        file_name="mortgage_schedule.parquet",
+        mime=PARQUET_MIME,
+    )
+with col2:
+    st.download_button(
+        "Download Feather",
+        feather_bytes,
+        file_name="mortgage_schedule.feather",
+        mime=FEATHER_MIME,
+    )
+
+# ---------------- Speculative precompute ----------------
+# Most edits are a single stepper click, so once this rerun has rendered, warm
+# the shared store with one step either side of the input that changed last.
+if "prefetch_owner" not in st.session_state:
+    st.session_state.prefetch_owner = uuid.uuid4().hex
+last_inputs = st.session_state.get("last_inputs", scenario_inputs)
+changed = [key for key in PREFETCH_INPUTS if scenario_inputs[key] != last_inputs[key]]
+if changed:
+    st.session_state.last_touched = changed[0]
+st.session_state.last_inputs = scenario_inputs
+
+touched = st.session_state.get("last_touched")
+if touched is not None:
+    min_value, max_value, step = INPUT_RANGES[touched]
+    neighbours = []
+    for value in (scenario_inputs[touched] - step, scenario_inputs[touched] + step):
+        value = round(value, 2)
+        if not min_value <= value <= max_value:
+            continue
+        inputs = dict(scenario_inputs, **{touched: value})
+        if touched == "price":
+            # A new price re-creates the down payment widget and moves a
+            # percentage-based property tax
+            inputs["down"] = url_number("d", int(value * 0.30), 0, value)
+            if tax_method != "Monthly amount":
+                inputs["tax_month"] = int(value * (tax_pct / 100) / 12)
+        try:
+            neighbours.append(build_scenario(**inputs))
+        except ValueError:
+            continue
+    # The horizons this rerun asked for: the charts' and, for browser-side charts
+    # or a full-term export, the whole term
+    horizons = [max_months]
+    if browser_charts or full_term:
+        horizons.append(None)
+    prefetcher().submit(st.session_state.prefetch_owner, neighbours, horizons)
+
+# ---------------- Memory accounting ----------------
+# What this rerun built, per session; objects from the previous rerun are
+# garbage by now, so each record replaces the last
+session_monitor().record(
+    current_session_id(),
+    session_state=st.session_state.to_dict(),
+    schedules=[v for v in globals().values() if isinstance(v, pd.DataFrame)],
+    figures=[v for v in globals().values() if isinstance(v, go.Figure)],
+)
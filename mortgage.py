@@ -0,0 +1,1342 @@
+"""Mortgage simulation and tax engine shared by the Streamlit UI and the HTTP API"""
+
+import numpy as np
+import pandas as pd
+
+from escalation import (
+    DEFAULT_REASSESSMENT_CAP,
+    TAX_ESCALATIONS,
+    escalation_arrays,
+    insurance_growth,
+    tax_growth,
+)
+from recast_kernel import HAVE_NUMBA, STATE_COLUMNS, amortize_batch
+
+RECAST_METHODS = ("Savings-based", "Fixed lump sum")
+
+MAX_PRICE = 10_000_000  # upper end of the purchase price input
+# (min, max, step) of the numeric scenario inputs: the sidebar widgets' ranges,
+# which the API enforces too
+INPUT_RANGES = {
+    "price": (100_000, MAX_PRICE, 25_000),
+    "down": (0, MAX_PRICE, 10_000),
+    "rate": (0.1, 15.0, 0.05),
+    "term_years": (5, 40, 1),
+    "tax_month": (0, 50_000, 50),
+    "tax_appreciation": (0.0, 10.0, 0.1),
+    "tax_cap": (0.0, 10.0, 0.5),
+    "ins_month": (0, 5_000, 25),
+    "ins_inflation": (0.0, 15.0, 0.5),
+    "recast_int": (3, 60, 3),
+    "initial_cash": (0, 2_000_000, 10_000),
+    "surplus": (0, 50_000, 500),
+    "buffer_cash": (0, 1_000_000, 10_000),
+    "lump": (0, 1_000_000, 10_000),
+    "benefit_income": (0, 10_000_000, 10_000),
+}
+
+# Bump whenever simulation results change, so persisted caches are not reused
+ENGINE_VERSION = 2
+
+# Recast / no-recast schedule column order
+RECAST_COLUMNS = (
+    "Month",
+    "P&I",
+    "Tax",
+    "TotalPayment",
+    "CumulativePaid",
+    "Balance",
+    "RecastAmount",
+    "CumulativeRecast",
+    "IsPaidOff",
+    "SavingsBalance",
+    "MonthlyInterest",
+    "MonthlyTaxBenefit",
+    "EffectivePayment",
+)
+NO_RECAST_COLUMNS = (
+    "Month",
+    "TotalPayment",
+    "Tax",
+    "CumulativePaid",
+    "Balance",
+    "IsPaidOff",
+    "SavingsBalance",
+)
+
+
+def calculate_fica_tax_2025(income, filing_status="married"):
+    """Calculate FICA (Social Security and Medicare) taxes"""
+    ss_wage_limit = 167700  # 2025 Social Security wage base
+    medicare_additional_threshold = 250000 if filing_status == "married" else 200000
+
+    # Social Security (6.2% up to wage base limit)
+    ss_tax = min(income, ss_wage_limit) * 0.062
+
+    # Medicare (1.45% + 0.9% additional on high incomes)
+    medicare_tax = income * 0.0145
+    if income > medicare_additional_threshold:
+        medicare_tax += (income - medicare_additional_threshold) * 0.009
+
+    return ss_tax + medicare_tax
+
+
+def calculate_federal_tax_2025(income, filing_status="married"):
+    """Calculate federal tax for 2025 - married filing jointly"""
+    if filing_status == "married":
+        upper_rates = [
+            (23850, 0.10),
+            (96950, 0.12),
+            (206700, 0.22),
+            (394600, 0.24),
+            (501050, 0.32),
+            (751600, 0.35),
+            (float("inf"), 0.37),
+        ]
+    else:  # single
+        upper_rates = [
+            (11925, 0.10),
+            (48475, 0.12),
+            (103350, 0.22),
+            (197300, 0.24),
+            (250525, 0.32),
+            (626350, 0.35),
+            (float("inf"), 0.37),
+        ]
+    brackets = []
+    for i, rate in enumerate(upper_rates):
+        if i == 0:
+            brackets.append((0, rate[0], rate[1]))
+        else:
+            brackets.append((upper_rates[i - 1][0], rate[0], rate[1]))
+
+    tax = 0
+    for i, (lower, upper, rate) in enumerate(brackets):
+        if income > lower:
+            taxable_amount = min(income - lower, upper - lower)
+            tax += taxable_amount * rate
+
+    return tax
+
+
+def calculate_ca_tax_2025(income, filing_status="married"):
+    """Calculate California state tax for 2025 - married filing jointly"""
+    if filing_status == "married":
+        upper_rates = [
+            (20198, 0.01),
+            (47884, 0.02),
+            (75576, 0.04),
+            (104910, 0.06),
+            (132590, 0.08),
+            (677278, 0.093),
+            (812728, 0.103),
+            (1354550, 0.113),
+            (float("inf"), 0.123),
+        ]
+    else:  # single
+        upper_rates = [
+            (10099, 0.01),
+            (23942, 0.02),
+            (37788, 0.04),
+            (52455, 0.06),
+            (66295, 0.08),
+            (338639, 0.093),
+            (406364, 0.103),
+            (677275, 0.113),
+            (float("inf"), 0.123),
+        ]
+    brackets = []
+    for i, rate in enumerate(upper_rates):
+        if i == 0:
+            brackets.append((0, rate[0], rate[1]))
+        else:
+            brackets.append((upper_rates[i - 1][0], rate[0], rate[1]))
+
+    tax = 0
+    for i, (lower, upper, rate) in enumerate(brackets):
+        if income > lower:
+            taxable_amount = min(income - lower, upper - lower)
+            tax += taxable_amount * rate
+
+    return tax
+
+
+def calculate_effective_tax_rate(income, filing_status="married"):
+    """Calculate combined effective tax rate including federal, CA state, and FICA taxes"""
+    federal_tax = calculate_federal_tax_2025(income, filing_status)
+    ca_tax = calculate_ca_tax_2025(income, filing_status)
+    fica_tax = calculate_fica_tax_2025(income, filing_status)
+    total_tax = federal_tax + ca_tax + fica_tax
+    return (total_tax / income) * 100 if income > 0 else 0
+
+
+def payment(balance, months_left, r_monthly):
+    return balance * r_monthly / (1 - (1 + r_monthly) ** -months_left)
+
+
+def tax_benefit_income(use_secondary, gross_income, gross_income2):
+    """Pick the income used for the tax benefit calculation (0 disables it)"""
+    if use_secondary == "Secondary Income" and gross_income2 > 0:
+        return gross_income2
+    return gross_income if gross_income > 0 else 0
+
+
+def build_scenario(
+    price,
+    down,
+    rate,
+    term_years,
+    tax_month,
+    ins_month,
+    tax_appreciation=0.0,
+    method="Savings-based",
+    recast_int=12,
+    initial_cash=0,
+    surplus=0,
+    buffer_cash=0,
+    lump=0,
+    benefit_income=0,
+    start_month=1,
+    tax_escalation="Compound",
+    tax_cap=DEFAULT_REASSESSMENT_CAP,
+    ins_inflation=0.0,
+    rate_events=(),
+):
+    """Convert user-facing inputs into the keyword arguments of simulate().
+
+    ``rate_events`` are rate changes during the loan: dicts with ``month``
+    (the first month charged at the new rate, from 2 to the last month of
+    the term), ``rate`` (annual %) and optionally ``kind`` ("Reset" or
+    "Refinance") and ``closing_costs`` (paid in cash by a refinance). Both
+    tracks re-amortize their balance over the rest of the term at each one.
+    """
+    if method not in RECAST_METHODS:
+        raise ValueError(f"method must be one of {RECAST_METHODS}")
+    if tax_escalation not in TAX_ESCALATIONS:
+        raise ValueError(f"tax_escalation must be one of {TAX_ESCALATIONS}")
+    if not 0 <= down <= price:
+        raise ValueError("down payment must be between 0 and the purchase price")
+    if rate <= 0 or term_years <= 0 or recast_int <= 0:
+        raise ValueError("rate, term_years and recast_int must be positive")
+    # A fractional term would be truncated (0.5 years to a zero-month loan)
+    if term_years != int(term_years) or recast_int != int(recast_int):
+        raise ValueError("term_years and recast_int must be whole numbers")
+    if start_month not in range(1, 13):
+        raise ValueError("start_month must be a calendar month from 1 to 12")
+    events = []
+    for event in sorted(rate_events, key=lambda event: event["month"]):
+        kind = event.get("kind", "Reset")
+        if kind not in RATE_EVENT_KINDS:
+            raise ValueError(f"kind must be one of {RATE_EVENT_KINDS}")
+        if event["month"] not in range(2, int(term_years) * 12 + 1):
+            raise ValueError("rate changes need a month from 2 to the end of the term")
+        if event["rate"] <= 0 or event.get("closing_costs", 0) < 0:
+            raise ValueError("rate changes need a positive rate and closing costs >= 0")
+        # The schedules keep the loan's term; see amortize_segments() for new terms
+        if event.get("term_mo") is not None:
+            raise ValueError("a refinance here keeps the remaining term")
+        if events and event["month"] == events[-1]["month"]:
+            raise ValueError("at most one rate change per month")
+        events.append(
+            {
+                "month": event["month"],
+                "rate": event["rate"],
+                "kind": kind,
+                # As in amortize_segments(), only a refinance has closing costs
+                "closing_costs": (
+                    event.get("closing_costs", 0) if kind == "Refinance" else 0
+                ),
+            }
+        )
+
+    # Surplus and buffer only apply to savings-based recasting, lump only to fixed
+    if method == "Savings-based":
+        lump = 0
+    else:
+        surplus = 0
+        buffer_cash = 0
+
+    return {
+        "term_mo": int(term_years) * 12,
+        "r_mo": rate / 100 / 12,
+        "tax": tax_month,
+        "ins": ins_month,
+        "loan": price - down,
+        "tax_appreciation": tax_appreciation,
+        "method": method,
+        "recast_int": int(recast_int),
+        "initial_cash": initial_cash,
+        "surplus": surplus,
+        "buffer_cash": buffer_cash,
+        "lump": lump,
+        "benefit_income": benefit_income,
+        "start_month": int(start_month),
+        "tax_escalation": tax_escalation,
+        "tax_cap": tax_cap,
+        "ins_inflation": ins_inflation,
+        "rate_events": events,
+    }
+
+
+def tax_year_end(month, start_month=1):
+    """Last month of the tax year containing ``month`` (broadcasts over arrays).
+
+    Month 1 is the first payment, made in calendar month ``start_month``.
+    """
+    offset = np.asarray(start_month) - 1
+    return ((month + offset - 1) // 12 + 1) * 12 - offset
+
+
+def tax_year_benefit(
+    interest, monthly_tax, income, loan, start_month=1, filing_status="married"
+):
+    """Deduction benefit per month, evaluated once per calendar year.
+
+    Interest and property tax are totalled per tax year, itemized deductions
+    are compared with the standard deduction on those totals, and each year's
+    benefit is spread evenly over the months paid in it. ``interest`` and
+    ``monthly_tax`` are (M,) or (N, M) arrays of months 1..M; ``income``,
+    ``loan`` and ``start_month`` are scalars or one value per row. NaN months
+    (past a term) are skipped and stay NaN.
+    """
+    shape = np.shape(interest)
+    interest = np.atleast_2d(interest)
+    monthly_tax = np.atleast_2d(monthly_tax)
+    n, months = interest.shape
+    income = np.asarray(income, dtype=float).reshape(-1, 1)
+    loan = np.asarray(loan, dtype=float).reshape(-1, 1)
+    offset = np.broadcast_to(np.asarray(start_month, dtype=int) - 1, (n,))
+
+    # Shift each row so that column 0 is January, then fold into (N, years, 12)
+    rows = np.arange(n)[:, None]
+    cols = np.arange(months) + offset[:, None]
+    n_years = -(-(months + int(offset.max())) // 12)
+    live = ~np.isnan(interest)
+
+    def by_year(values):
+        padded = np.zeros((n, n_years * 12))
+        padded[rows, cols] = np.where(live, values, 0.0)
+        return padded.reshape(n, n_years, 12).sum(axis=2)
+
+    # Property tax is passed as a monthly average, as calculate_tax_benefit() expects
+    yearly = tax_benefit_array(
+        by_year(interest), by_year(monthly_tax) / 12, income, loan, filing_status
+    )
+    per_month = yearly / np.maximum(by_year(live), 1)
+    benefit = np.where(income > 0, per_month[rows, cols // 12], 0.0)
+    benefit[~live] = np.nan
+    return benefit.reshape(shape)
+
+
+def simulate_tracks(
+    term_mo,
+    r_mo,
+    tax,
+    ins,
+    loan,
+    tax_appreciation=0.0,
+    method="Savings-based",
+    recast_int=12,
+    initial_cash=0,
+    surplus=0,
+    buffer_cash=0,
+    lump=0,
+    benefit_income=0,
+    start_month=1,
+    tax_escalation="Compound",
+    tax_cap=DEFAULT_REASSESSMENT_CAP,
+    ins_inflation=0.0,
+    rate_events=(),
+    months=None,
+):
+    """Recast and no-recast schedules in a single pass over the months.
+
+    Stops after ``months`` (e.g. the chart horizon) when given, otherwise runs
+    the full term. Deductions are computed per tax year afterwards (see
+    tax_year_benefit()), so a partial last year is run to its end first.
+    """
+    horizon = term_mo if months is None else min(int(months), term_mo)
+    run_to = min(int(tax_year_end(horizon, start_month)), term_mo)
+    tax_factor = tax_growth(tax_appreciation, run_to, tax_escalation, tax_cap)
+    monthly_taxes = (tax * tax_factor).tolist()
+    monthly_ins = (ins * insurance_growth(ins_inflation, run_to)).tolist()
+    rates, closing_costs = monthly_rates([r_mo], [rate_events], run_to)
+
+    balance = loan
+    p_i = payment(balance, term_mo, r_mo)
+    savings = initial_cash  # Start with initial cash
+    cum_paid = 0
+    cum_recast = 0
+    balance0 = loan  # no-recast track
+    p_i0 = p_i
+    savings0 = initial_cash
+    cum_paid0 = 0
+    # MonthlyTaxBenefit and EffectivePayment are added once the year totals are known
+    out = {col: [] for col in RECAST_COLUMNS[:-2]}
+    out0 = {col: [] for col in NO_RECAST_COLUMNS}
+
+    # Continue to term_mo even after loan is paid, for tax/insurance
+    for m, (current_tax, current_ins, rate, closing) in enumerate(
+        zip(monthly_taxes, monthly_ins, rates[0].tolist(), closing_costs[0].tolist()),
+        start=1,
+    ):
+        if rate != r_mo:
+            # A rate change re-amortizes both tracks over the rest of the term
+            r_mo = rate
+            if balance > 0:
+                p_i = payment(balance, term_mo - m + 1, r_mo)
+            if balance0 > 0:
+                p_i0 = payment(balance0, term_mo - m + 1, r_mo)
+        # Closing costs are only paid while there is a loan to refinance
+        closing0 = closing if balance0 > 0 else 0
+        closing = closing if balance > 0 else 0
+
+        # pay mortgage this month
+        interest = balance * r_mo if balance > 0 else 0
+        principal = p_i - interest if balance > 0 else 0
+        if balance > 0:
+            balance -= principal
+        total_pmt = (p_i if balance > 0 else 0) + current_tax + current_ins + closing
+
+        recast_amount = 0
+        # handle savings / lump only if there's still a balance
+        if balance > 0:
+            savings += surplus  # Add monthly savings first
+            if m % recast_int == 0:
+                if method == "Savings-based":
+                    recast_amount = min(max(0, savings - buffer_cash), balance)
+                elif lump > 0 and savings >= lump:
+                    recast_amount = min(lump, balance)
+            # Don't recast more than remaining balance
+            if recast_amount > 0:
+                balance -= recast_amount
+                savings -= recast_amount
+                if balance <= 0:
+                    p_i = 0
+                else:
+                    p_i = payment(balance, term_mo - m, r_mo)
+
+        cum_recast += recast_amount
+        cum_paid += total_pmt  # Only include regular payment in cumulative
+
+        out["Month"].append(m)
+        out["P&I"].append(p_i if balance > 0 else 0)
+        out["Tax"].append(current_tax)
+        out["TotalPayment"].append(total_pmt)
+        # Add recast total to cumulative only when reporting
+        out["CumulativePaid"].append(cum_paid + cum_recast)
+        out["Balance"].append(balance)
+        out["RecastAmount"].append(recast_amount)
+        out["CumulativeRecast"].append(cum_recast)
+        out["IsPaidOff"].append(balance <= 0)
+        out["SavingsBalance"].append(savings)
+        out["MonthlyInterest"].append(interest)
+
+        # Same month without recasting; savings still accumulate but are never used
+        interest0 = balance0 * r_mo if balance0 > 0 else 0
+        if balance0 > 0:
+            balance0 -= p_i0 - interest0
+        total_pmt0 = (
+            (p_i0 if balance0 > 0 else 0) + current_tax + current_ins + closing0
+        )
+        savings0 += surplus
+        cum_paid0 += total_pmt0
+
+        out0["Month"].append(m)
+        out0["TotalPayment"].append(total_pmt0)
+        out0["Tax"].append(current_tax)
+        out0["CumulativePaid"].append(cum_paid0)
+        out0["Balance"].append(balance0)
+        out0["IsPaidOff"].append(balance0 <= 0)
+        out0["SavingsBalance"].append(savings0)
+
+    df = pd.DataFrame(out)
+    df["MonthlyTaxBenefit"] = tax_year_benefit(
+        df["MonthlyInterest"].to_numpy(),
+        df["Tax"].to_numpy(),
+        benefit_income,
+        loan,
+        start_month,
+    )
+    df["EffectivePayment"] = df["TotalPayment"] - df["MonthlyTaxBenefit"]
+    return df.iloc[:horizon], pd.DataFrame(out0).iloc[:horizon]
+
+
+def simulate(term_mo, r_mo, tax, ins, loan, **kwargs):
+    """Recast schedule only (see simulate_tracks())"""
+    return simulate_tracks(term_mo, r_mo, tax, ins, loan, **kwargs)[0]
+
+
+def simulate_no_recast(
+    term_mo,
+    r_mo,
+    tax,
+    ins,
+    loan,
+    tax_appreciation=0.0,
+    initial_cash=0,
+    surplus=0,
+    rate_events=(),
+):
+    """No-recast schedule only (see simulate_tracks())"""
+    return simulate_tracks(
+        term_mo,
+        r_mo,
+        tax,
+        ins,
+        loan,
+        tax_appreciation=tax_appreciation,
+        initial_cash=initial_cash,
+        surplus=surplus,
+        rate_events=rate_events,
+    )[1]
+
+
+def run_scenario(scenario, months=None):
+    """Recast and no-recast schedules for a build_scenario() dict.
+
+    ``months`` limits the run to a display horizon; omit it for full-term stats.
+    """
+    if HAVE_NUMBA:
+        # Compiled kernel; simulate_tracks() is the pure-Python reference
+        df, df_no_recast = simulate_batch([scenario], months)
+        return df.drop(columns="Scenario"), df_no_recast.drop(columns="Scenario")
+    return simulate_tracks(**scenario, months=months)
+
+
+def summarize(df, df_no_recast):
+    """Summary statistics shown under the charts, as plain floats"""
+    total_paid = float(df["TotalPayment"].sum())
+    total_tax_benefit = float(df["MonthlyTaxBenefit"].sum())
+    return {
+        "total_paid": total_paid,
+        "total_tax_benefit": total_tax_benefit,
+        "total_effective_cost": total_paid - total_tax_benefit,
+        "ending_balance": float(df["Balance"].iloc[-1]),
+        "total_recast": float(df["RecastAmount"].sum()),
+        "recast_count": int((df["RecastAmount"] > 0).sum()),
+        "no_recast_total_paid": float(df_no_recast["TotalPayment"].sum()),
+        "no_recast_ending_balance": float(df_no_recast["Balance"].iloc[-1]),
+    }
+
+
+def calculate_tax_benefit(
+    yearly_interest, property_tax, income, loan, filing_status="married"
+):
+    """Calculate tax benefit from mortgage interest and property tax deductions"""
+    # Constants for 2025
+    STANDARD_DEDUCTION = 29850 if filing_status == "married" else 14925
+    SALT_LIMIT = 10000
+    MORTGAGE_LIMIT = 750000
+
+    # Limit mortgage interest deduction based on loan balance
+    effective_ratio = min(MORTGAGE_LIMIT / loan, 1) if loan > 0 else 0
+    deductible_interest = yearly_interest * effective_ratio
+
+    # Calculate SALT (State And Local Tax) deduction
+    deductible_salt = min(property_tax * 12, SALT_LIMIT)  # Property tax is monthly
+
+    # Total itemized deductions
+    total_itemized = deductible_interest + deductible_salt
+
+    # Only beneficial if itemized > standard
+    if total_itemized <= STANDARD_DEDUCTION:
+        return 0
+
+    # Calculate marginal benefit on amount over standard deduction
+    excess_deduction = total_itemized - STANDARD_DEDUCTION
+
+    # Get marginal rates
+    if filing_status == "married":
+        if income <= 203300:
+            federal_marginal = 0.22
+        elif income <= 398400:
+            federal_marginal = 0.24
+        elif income <= 504550:
+            federal_marginal = 0.32
+        elif income <= 755100:
+            federal_marginal = 0.35
+        else:
+            federal_marginal = 0.37
+    else:  # single
+        if income <= 103350:
+            federal_marginal = 0.22
+        elif income <= 197300:
+            federal_marginal = 0.24
+        elif income <= 250525:
+            federal_marginal = 0.32
+        elif income <= 626350:
+            federal_marginal = 0.35
+        else:
+            federal_marginal = 0.37
+
+    # Get CA state marginal rate
+    if filing_status == "married":
+        if income <= 75576:
+            state_marginal = 0.04
+        elif income <= 104910:
+            state_marginal = 0.06
+        elif income <= 132590:
+            state_marginal = 0.08
+        elif income <= 677278:
+            state_marginal = 0.093
+        elif income <= 812728:
+            state_marginal = 0.103
+        elif income <= 1354550:
+            state_marginal = 0.113
+        else:
+            state_marginal = 0.123
+    else:  # single
+        if income <= 37788:
+            state_marginal = 0.04
+        elif income <= 52455:
+            state_marginal = 0.06
+        elif income <= 66295:
+            state_marginal = 0.08
+        elif income <= 338639:
+            state_marginal = 0.093
+        elif income <= 406364:
+            state_marginal = 0.103
+        elif income <= 677275:
+            state_marginal = 0.113
+        else:
+            state_marginal = 0.123
+
+    # Combine rates and calculate tax benefit
+    combined_marginal = federal_marginal + state_marginal
+    tax_benefit = excess_deduction * combined_marginal
+
+    return tax_benefit
+
+
+# ---------------- Batched engine ----------------
+# Marginal rate tables used by calculate_tax_benefit(): (upper bounds, rates)
+FEDERAL_MARGINAL = {
+    "married": ((203300, 398400, 504550, 755100), (0.22, 0.24, 0.32, 0.35, 0.37)),
+    "single": ((103350, 197300, 250525, 626350), (0.22, 0.24, 0.32, 0.35, 0.37)),
+}
+CA_MARGINAL = {
+    "married": (
+        (75576, 104910, 132590, 677278, 812728, 1354550),
+        (0.04, 0.06, 0.08, 0.093, 0.103, 0.113, 0.123),
+    ),
+    "single": (
+        (37788, 52455, 66295, 338639, 406364, 677275),
+        (0.04, 0.06, 0.08, 0.093, 0.103, 0.113, 0.123),
+    ),
+}
+
+
+def marginal_rate_array(income, filing_status="married"):
+    """Combined federal + CA marginal rate for an array of incomes"""
+    fed_upper, fed_rates = FEDERAL_MARGINAL[filing_status]
+    ca_upper, ca_rates = CA_MARGINAL[filing_status]
+    federal = np.asarray(fed_rates)[np.searchsorted(fed_upper, income)]
+    state = np.asarray(ca_rates)[np.searchsorted(ca_upper, income)]
+    return federal + state
+
+
+def tax_benefit_array(
+    yearly_interest, property_tax, income, loan, filing_status="married"
+):
+    """calculate_tax_benefit() over NumPy arrays (arguments broadcast)"""
+    standard_deduction = 29850 if filing_status == "married" else 14925
+    loan = np.asarray(loan, dtype=float)
+    safe_loan = np.where(loan > 0, loan, 1)
+    effective_ratio = np.where(loan > 0, np.minimum(750000 / safe_loan, 1), 0)
+    total_itemized = yearly_interest * effective_ratio + np.minimum(
+        property_tax * 12, 10000
+    )
+    excess_deduction = total_itemized - standard_deduction
+    return np.where(
+        excess_deduction > 0,
+        excess_deduction * marginal_rate_array(income, filing_status),
+        0.0,
+    )
+
+
+def payment_array(balance, months_left, r_monthly):
+    """payment() for arrays; months_left == 0 yields inf like the scalar formula"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return balance * r_monthly / (1 - (1 + r_monthly) ** -months_left)
+
+
+def scenario_arrays(scenarios):
+    """Stack build_scenario() dicts into one float array per input"""
+    batch = {
+        key: np.array([s[key] for s in scenarios], dtype=float)
+        for key in scenarios[0]
+        if key not in ("method", "tax_escalation", "rate_events")
+    }
+    batch["rate_events"] = [s["rate_events"] for s in scenarios]
+    batch["savings_based"] = np.array(
+        [s["method"] == "Savings-based" for s in scenarios]
+    )
+    batch["annual_reassessment"] = np.array(
+        [s["tax_escalation"] == "Annual reassessment" for s in scenarios]
+    )
+    return batch
+
+
+def amortize_vectorized(b, rates, horizon):
+    """NumPy counterpart of recast_kernel.amortize_batch() for scenario_arrays() input.
+
+    Months are stepped in a loop but every step is vectorized across
+    scenarios, so N scenarios cost about as much as one.
+    """
+    term, r = b["term_mo"], b["r_mo"]
+    state = np.full((len(STATE_COLUMNS), len(term), horizon), np.nan)
+
+    balance = b["loan"].copy()
+    p_i = payment_array(balance, term, r)
+    savings = b["initial_cash"].copy()
+    balance0 = b["loan"].copy()
+    p_i0 = p_i.copy()
+    savings_based = b["savings_based"]
+
+    for m in range(1, horizon + 1):
+        live = m <= term
+        # A rate change re-amortizes both tracks over the rest of the term
+        changed = rates[:, m - 1] != r
+        r = rates[:, m - 1]
+        p_i = np.where(
+            changed & (balance > 0), payment_array(balance, term - m + 1, r), p_i
+        )
+        p_i0 = np.where(
+            changed & (balance0 > 0), payment_array(balance0, term - m + 1, r), p_i0
+        )
+
+        # Recast track
+        open_ = balance > 0
+        interest = np.where(open_, balance * r, 0.0)
+        balance = np.where(open_, balance - (p_i - interest), balance)
+        paid = np.where(balance > 0, p_i, 0.0)
+
+        open_ = balance > 0
+        savings = np.where(open_, savings + b["surplus"], savings)
+        due = open_ & (m % b["recast_int"] == 0)
+        extra = np.maximum(0, savings - b["buffer_cash"])
+        do_savings = due & savings_based & (extra > 0)
+        do_lump = due & ~savings_based & (b["lump"] > 0) & (savings >= b["lump"])
+        recast_amount = np.where(
+            do_savings,
+            np.minimum(extra, balance),
+            np.where(do_lump, np.minimum(b["lump"], balance), 0.0),
+        )
+        balance = balance - recast_amount
+        savings = savings - recast_amount
+        p_i = np.where(
+            do_savings | do_lump,
+            np.where(balance <= 0, 0.0, payment_array(balance, term - m, r)),
+            p_i,
+        )
+
+        # No-recast track
+        open0 = balance0 > 0
+        balance0 = np.where(open0, balance0 - (p_i0 - balance0 * r), balance0)
+
+        month = np.stack(
+            (
+                interest,
+                paid,
+                np.where(balance > 0, p_i, 0.0),
+                balance,
+                recast_amount,
+                savings,
+                np.where(balance0 > 0, p_i0, 0.0),
+                balance0,
+            )
+        )
+        state[:, live, m - 1] = month[:, live]
+
+    return state
+
+
+def simulate_arrays(scenarios, months=None):
+    """Recast and no-recast tracks for many scenarios in one pass.
+
+    The path-dependent amortization runs in the compiled recast_kernel when
+    numba is installed (otherwise vectorized NumPy); taxes, running totals and
+    per-tax-year deductions are then computed for all months and scenarios at
+    once. Returns two dicts of (N, M) arrays with the
+    simulate()/simulate_no_recast() columns; months past a scenario's term are
+    NaN.
+    """
+    b = scenario_arrays(scenarios)
+    term = b["term_mo"]
+    horizon = int(term.max()) if months is None else min(int(months), int(term.max()))
+    # Run on to the end of the tax year so the last year's deductions are complete
+    run_to = min(int(tax_year_end(horizon, b["start_month"]).max()), int(term.max()))
+
+    rates, closing_costs = monthly_rates(b["r_mo"], b["rate_events"], run_to)
+    if HAVE_NUMBA:
+        state = amortize_batch(
+            b["loan"],
+            rates,
+            term.astype(np.int64),
+            run_to,
+            b["savings_based"],
+            b["recast_int"].astype(np.int64),
+            b["initial_cash"],
+            b["surplus"],
+            b["buffer_cash"],
+            b["lump"],
+        )
+    else:
+        state = amortize_vectorized(b, rates, run_to)
+    s = dict(zip(STATE_COLUMNS, state))
+
+    live = ~np.isnan(s["Balance"])
+    # Escalation rows are computed once and shared by both tracks
+    monthly_taxes, ins = escalation_arrays(b, run_to)
+    monthly_taxes[~live] = np.nan
+
+    total_pmt = (
+        s["PaidPI"]
+        + monthly_taxes
+        + ins
+        + refinance_costs(closing_costs, b["loan"], s["Balance"])
+    )
+    benefit = tax_year_benefit(
+        s["MonthlyInterest"],
+        monthly_taxes,
+        b["benefit_income"],
+        b["loan"],
+        b["start_month"],
+    )
+    cum_recast = np.cumsum(s["RecastAmount"], axis=1)
+    out = {
+        "P&I": s["P&I"],
+        "Tax": monthly_taxes,
+        "TotalPayment": total_pmt,
+        "CumulativePaid": np.cumsum(total_pmt, axis=1) + cum_recast,
+        "Balance": s["Balance"],
+        "RecastAmount": s["RecastAmount"],
+        "CumulativeRecast": cum_recast,
+        "SavingsBalance": s["SavingsBalance"],
+        "MonthlyInterest": s["MonthlyInterest"],
+        "MonthlyTaxBenefit": benefit,
+        "EffectivePayment": total_pmt - benefit,
+    }
+
+    # Without recasting, savings simply accumulate every month
+    deposits = np.repeat(b["surplus"][:, None], run_to, axis=1)
+    deposits[:, 0] += b["initial_cash"]
+    savings0 = np.cumsum(deposits, axis=1)
+    savings0[~live] = np.nan
+    total_pmt0 = (
+        s["NoRecastPaidPI"]
+        + monthly_taxes
+        + ins
+        + refinance_costs(closing_costs, b["loan"], s["NoRecastBalance"])
+    )
+    out_base = {
+        "TotalPayment": total_pmt0,
+        "Tax": monthly_taxes,
+        "CumulativePaid": np.cumsum(total_pmt0, axis=1),
+        "Balance": s["NoRecastBalance"],
+        "SavingsBalance": savings0,
+    }
+    return tuple(
+        {col: values[:, :horizon] for col, values in arrays.items()}
+        for arrays in (out, out_base)
+    )
+
+
+def refinance_costs(closing_costs, loan, balance):
+    """monthly_rates() closing costs for the months that start with a loan open"""
+    opening = np.concatenate((loan[:, None], balance[:, :-1]), axis=1)
+    return np.where(opening > 0, closing_costs, 0.0)
+
+
+def long_frame(arrays, columns):
+    """(N, M) arrays -> long DataFrame with a Scenario column, dropping padding"""
+    n, horizon = arrays["Balance"].shape
+    frame = {"Scenario": np.repeat(np.arange(n), horizon)}
+    for col in columns:
+        if col == "Month":
+            frame[col] = np.tile(np.arange(1, horizon + 1), n)
+        elif col == "IsPaidOff":
+            frame[col] = arrays["Balance"].ravel() <= 0
+        else:
+            frame[col] = arrays[col].ravel()
+    frame = pd.DataFrame(frame)
+    return frame[~np.isnan(arrays["Balance"].ravel())].reset_index(drop=True)
+
+
+def simulate_batch(scenarios, months=None):
+    """run_scenario() for a list of scenarios via one simulate_arrays() pass.
+
+    Returns long-form (df, df_no_recast) with a Scenario column holding each
+    scenario's position in the list.
+    """
+    out, out_base = simulate_arrays(scenarios, months)
+    return long_frame(out, RECAST_COLUMNS), long_frame(out_base, NO_RECAST_COLUMNS)
+
+
+# ---------------- Affordability ----------------
+
+
+def monthly_cost_array(
+    price,
+    down,
+    rate,
+    term_years,
+    tax_month,
+    ins_month,
+    tax_pct=None,
+    benefit_income=0,
+    effective=False,
+):
+    """Monthly housing cost for arrays of inputs (arguments broadcast).
+
+    P&I + property tax + insurance in the first month, i.e. the numerator of
+    the front-end DTI. With a ``tax_pct`` the property tax follows the price
+    like the "Annual percentage" input. With ``effective``, the deduction
+    benefit of the first twelve months is subtracted (as a monthly average),
+    matching EffectivePayment. Closed form, so no schedule is simulated.
+    """
+    price = np.asarray(price, dtype=float)
+    loan = np.maximum(price - down, 0.0)
+    r_mo = rate / 100 / 12
+    p_i = payment_array(loan, np.asarray(term_years) * 12, r_mo)
+    if tax_pct is not None:
+        tax_month = price * (tax_pct / 100) / 12
+    cost = p_i + tax_month + ins_month
+    if effective and benefit_income > 0:
+        # Interest paid in months 1-12 = payments minus principal repaid
+        growth = (1 + r_mo) ** 12
+        balance_12 = loan * growth - p_i * (growth - 1) / r_mo
+        interest_12 = 12 * p_i - (loan - balance_12)
+        cost = (
+            cost - tax_benefit_array(interest_12, tax_month, benefit_income, loan) / 12
+        )
+    return cost
+
+
+def goal_seek(solve_for, target, price, down, tol=1.0, **cost_inputs):
+    """Largest price or smallest down payment whose monthly cost stays within ``target``.
+
+    ``solve_for`` is "price" (keeping ``down`` fixed) or "down" (keeping
+    ``price`` fixed); ``target`` is a monthly cost in dollars, either a scalar
+    or an array to solve several limits at once. The remaining arguments go to
+    monthly_cost_array(), whose cost rises with the loan, so bisection over the
+    bracket [down, MAX_PRICE] or [0, price] converges to within ``tol``
+    dollars. Returns NaN where even the cheapest end of the bracket is over the
+    target.
+    """
+    if solve_for not in ("price", "down"):
+        raise ValueError("solve_for must be 'price' or 'down'")
+
+    def cost(x):
+        if solve_for == "price":
+            return monthly_cost_array(x, down, **cost_inputs)
+        return monthly_cost_array(price, x, **cost_inputs)
+
+    target = np.asarray(target, dtype=float)
+    if solve_for == "price":
+        cheap, dear = float(down), float(max(MAX_PRICE, down))
+    else:
+        cheap, dear = float(price), 0.0
+
+    # ``ok`` always satisfies the target and ``over`` never does
+    ok = np.full(target.shape, cheap)
+    over = np.full(target.shape, dear)
+    affordable = cost(ok) <= target
+    within = cost(over) <= target
+    ok[within] = dear
+    while np.any(np.abs(over - ok) > tol):
+        mid = (ok + over) / 2
+        fits = cost(mid) <= target
+        ok = np.where(fits, mid, ok)
+        over = np.where(fits, over, mid)
+    return np.where(affordable, ok, np.nan)
+
+
+# ---------------- Rate changes ----------------
+RATE_EVENT_KINDS = ("Reset", "Refinance")
+
+
+def rate_path_arrays(paths):
+    """Pad per-path event lists into (P, E) arrays for amortize_segments().
+
+    Each event is a dict with ``month`` (first month charged at the new
+    rate, from 2), ``rate`` (annual %) and optionally ``kind``: "Reset" (an
+    ARM adjustment; keeps the remaining term and is subject to caps) or
+    "Refinance" (a new loan for the balance, over ``term_mo`` months or the
+    remaining term, with ``closing_costs`` paid in cash).
+    """
+    width = max((len(events) for events in paths), default=0)
+    shape = (len(paths), width)
+    arrays = {
+        "month": np.full(shape, np.inf),
+        "rate": np.zeros(shape),
+        "refinance": np.zeros(shape, dtype=bool),
+        "term_mo": np.full(shape, np.nan),
+        "closing_costs": np.zeros(shape),
+    }
+    for i, events in enumerate(paths):
+        for j, event in enumerate(sorted(events, key=lambda e: e["month"])):
+            kind = event.get("kind", "Reset")
+            if kind not in RATE_EVENT_KINDS:
+                raise ValueError(f"kind must be one of {RATE_EVENT_KINDS}")
+            if event["month"] < 2 or event["rate"] <= 0:
+                raise ValueError("rate changes need a month from 2 and a positive rate")
+            if event.get("term_mo") is not None and event["term_mo"] < 1:
+                raise ValueError("a refinance term must be at least one month")
+            arrays["month"][i, j] = event["month"]
+            arrays["rate"][i, j] = event["rate"]
+            arrays["refinance"][i, j] = kind == "Refinance"
+            arrays["term_mo"][i, j] = event.get("term_mo", np.nan)
+            arrays["closing_costs"][i, j] = event.get("closing_costs", 0)
+    return arrays
+
+
+def monthly_rates(r_mo, rate_events, months):
+    """(N, months) monthly rate and refinance closing costs of each month.
+
+    ``r_mo`` (N,) are the scenarios' starting monthly rates and
+    ``rate_events`` their build_scenario() event lists.
+    """
+    events = rate_path_arrays(rate_events)
+    m = np.arange(1, months + 1)
+    rates = np.repeat(np.asarray(r_mo, dtype=float)[:, None], months, axis=1)
+    closing_costs = np.zeros(rates.shape)
+    # Events are sorted by month, so each later one overrides from its month on
+    for e in range(events["month"].shape[1]):
+        start = events["month"][:, e : e + 1]
+        rates = np.where(m >= start, events["rate"][:, e : e + 1] / 100 / 12, rates)
+        closing_costs += np.where(m == start, events["closing_costs"][:, e : e + 1], 0)
+    return rates, closing_costs
+
+
+def amortize_segments(loan, rate, term_mo, events, caps=None):
+    """Fixed-payment segments of P loans whose rate changes at ``events``.
+
+    ``events`` comes from rate_path_arrays(); ``loan``, ``rate`` (annual %)
+    and ``term_mo`` are scalars or (P,) arrays. ``caps`` = (periodic,
+    lifetime) limits each reset to that many points from the previous rate
+    and above the loan's starting rate. Between events the balance follows
+    the closed-form annuity, so the cost is one vectorized step per event
+    rather than per month.
+
+    Returns (P, E + 1) arrays "Start" (first month; inf for events after the
+    loan ended), "Rate", "Payment", "Balance" (at the start) and
+    "ClosingCosts", plus "End" (P,), the last month of the loan.
+    """
+    month = events["month"]
+    n_paths, n_events = month.shape
+    balance = np.broadcast_to(np.asarray(loan, dtype=float), (n_paths,)).copy()
+    current = np.broadcast_to(np.asarray(rate, dtype=float), (n_paths,)).copy()
+    remaining = np.broadcast_to(np.asarray(term_mo, dtype=float), (n_paths,)).copy()
+    start = np.ones(n_paths)
+    initial = current.copy()
+    pmt = payment_array(balance, remaining, current / 1200)
+
+    segments = {
+        "Start": [start],
+        "Rate": [current],
+        "Payment": [pmt],
+        "Balance": [balance],
+        "ClosingCosts": [np.zeros(n_paths)],
+    }
+    for e in range(n_events):
+        t = month[:, e]
+        active = t < start + remaining
+        k = np.where(active, t - start, 0)
+        growth = (1 + current / 1200) ** k
+        balance = balance * growth - pmt * (growth - 1) / (current / 1200)
+
+        refinance = events["refinance"][:, e]
+        new_rate = events["rate"][:, e]
+        if caps is not None:
+            periodic, lifetime = caps
+            capped = np.clip(new_rate, current - periodic, current + periodic)
+            new_rate = np.where(
+                refinance, new_rate, np.minimum(capped, initial + lifetime)
+            )
+        new_term = events["term_mo"][:, e]
+        refinance_term = np.where(np.isnan(new_term), remaining - k, new_term)
+
+        current = np.where(active, new_rate, current)
+        initial = np.where(active & refinance, new_rate, initial)
+        remaining = np.where(active & refinance, refinance_term, remaining - k)
+        start = np.where(active, t, start)
+        pmt = payment_array(balance, remaining, current / 1200)
+
+        segments["Start"].append(np.where(active, t, np.inf))
+        segments["Rate"].append(current)
+        segments["Payment"].append(pmt)
+        segments["Balance"].append(balance)
+        segments["ClosingCosts"].append(
+            np.where(active & refinance, events["closing_costs"][:, e], 0.0)
+        )
+
+    result = {key: np.stack(values, axis=1) for key, values in segments.items()}
+    result["End"] = start + remaining - 1
+    return result
+
+
+def segment_schedule(segments, months):
+    """Expand amortize_segments() output into (P, months) monthly arrays.
+
+    Returns "Rate", "P&I", "Interest", "Balance" (after the payment) and
+    "ClosingCosts"; months after the loan ends are 0.
+    """
+    m = np.arange(1, months + 1)
+    start = segments["Start"]
+    # Index of the segment each month falls in
+    idx = (start[:, None, :] <= m[None, :, None]).sum(axis=2) - 1
+
+    def at(key):
+        return np.take_along_axis(segments[key], idx, axis=1)
+
+    rate = at("Rate")
+    r_mo = rate / 1200
+    pmt = at("Payment")
+    growth = (1 + r_mo) ** (m - at("Start"))
+    before = at("Balance") * growth - pmt * (growth - 1) / r_mo
+    interest = before * r_mo
+    live = m <= segments["End"][:, None]
+    closing = np.zeros(idx.shape)
+    for s in range(start.shape[1]):
+        closing += np.where(
+            m == start[:, s : s + 1], segments["ClosingCosts"][:, s : s + 1], 0
+        )
+    return {
+        "Rate": np.where(live, rate, 0.0),
+        "P&I": np.where(live, pmt, 0.0),
+        "Interest": np.where(live, interest, 0.0),
+        "Balance": np.where(live, before - (pmt - interest), 0.0),
+        "ClosingCosts": closing,
+    }
+
+
+def refinance_break_even(
+    loan, rate, term_mo, refi_month, new_rate, closing_costs, new_term_mo=None
+):
+    """Months after refinancing until the interest saved covers the closing costs.
+
+    ``refi_month``, ``new_rate`` and ``closing_costs`` broadcast against each
+    other, so a whole grid of refinance options is one amortize_segments()
+    call; the result has their broadcast shape and is NaN where the savings
+    never catch up. The refinanced loan runs over ``new_term_mo`` months
+    (default: the remaining term).
+    """
+    refi_month, new_rate, closing_costs = np.broadcast_arrays(
+        np.asarray(refi_month, dtype=float), new_rate, closing_costs
+    )
+    shape = refi_month.shape
+    n = refi_month.size
+    events = {
+        "month": refi_month.reshape(n, 1),
+        "rate": np.asarray(new_rate, dtype=float).reshape(n, 1),
+        "refinance": np.ones((n, 1), dtype=bool),
+        "term_mo": np.full((n, 1), np.nan if new_term_mo is None else new_term_mo),
+        "closing_costs": np.asarray(closing_costs, dtype=float).reshape(n, 1),
+    }
+    refinanced = amortize_segments(loan, rate, term_mo, events)
+    horizon = int(max(term_mo, refinanced["End"].max()))
+    kept = segment_schedule(
+        amortize_segments(loan, rate, term_mo, rate_path_arrays([[]])), horizon
+    )
+    schedule = segment_schedule(refinanced, horizon)
+
+    saved = np.cumsum(kept["Interest"] - schedule["Interest"], axis=1)
+    m = np.arange(1, horizon + 1)
+    ahead = (saved >= events["closing_costs"]) & (m >= events["month"])
+    months = np.argmax(ahead, axis=1) + 1 - events["month"][:, 0] + 1
+    return np.where(ahead.any(axis=1), months, np.nan).reshape(shape)
+
+
+# ---------------- Rent vs buy ----------------
+def sample_return_paths(annual_return, volatility, months, n_paths=1, seed=0):
+    """Monthly investment returns, shape (n_paths, months).
+
+    With zero ``volatility`` every path earns the compound equivalent of
+    ``annual_return`` (%); otherwise returns are lognormal with that mean and
+    annual ``volatility`` (%). Seeded, so reruns draw the same paths.
+    """
+    if volatility <= 0:
+        monthly = (1 + annual_return / 100) ** (1 / 12) - 1
+        return np.full((n_paths, months), monthly)
+    sigma = volatility / 100 / np.sqrt(12)
+    mu = np.log(1 + annual_return / 100) / 12 - sigma**2 / 2
+    rng = np.random.default_rng(seed)
+    return np.expm1(rng.normal(mu, sigma, size=(n_paths, months)))
+
+
+def rent_vs_buy(
+    df,
+    price,
+    down,
+    rent,
+    monthly_returns,
+    initial_cash=0,
+    home_appreciation=3.0,
+    rent_growth=3.0,
+    selling_costs=6.0,
+    payment_column="TotalPayment",
+):
+    """Net worth of buying on the schedule ``df`` versus renting and investing.
+
+    The buyer's net worth is home value less selling costs and the loan
+    balance, plus savings. The renter starts with the down payment and initial
+    cash invested and each month invests whatever the buyer spent on housing
+    (``payment_column``) and savings deposits beyond the rent (withdrawing
+    when rent is higher). ``monthly_returns`` is (P, M) for P return paths;
+    all paths are solved at once in closed form.
+
+    Returns a dict with "buy" (M,), "rent" (P, M) and "break_even" (P,): the
+    month from which buying stays ahead on each path, NaN if it is still
+    behind after M months.
+    """
+    months = len(df)
+    t = np.arange(1, months + 1) / 12
+    home_value = price * (1 + home_appreciation / 100) ** t
+    savings = df["SavingsBalance"].to_numpy(dtype=float)
+    buy = (
+        home_value * (1 - selling_costs / 100)
+        - df["Balance"].to_numpy(dtype=float)
+        + savings
+    )
+
+    # Savings deposits are what remains after recasts are added back
+    deposits = np.diff(savings, prepend=initial_cash) + df["RecastAmount"].to_numpy(
+        dtype=float
+    )
+    rent_paid = rent * (1 + rent_growth / 100) ** (np.arange(months) // 12)
+    invested = df[payment_column].to_numpy(dtype=float) + deposits - rent_paid
+
+    # W_m = W_{m-1} (1 + r_m) + c_m  =>  W_m = G_m (W_0 + sum_k c_k / G_k)
+    growth = np.cumprod(1 + monthly_returns[:, :months], axis=1)
+    renter = growth * (down + initial_cash + np.cumsum(invested / growth, axis=1))
+
+    # Break even after the last month spent behind (volatile paths can cross back)
+    behind = buy < renter
+    last_behind = np.where(
+        behind.any(axis=1), months - np.argmax(behind[:, ::-1], axis=1), 0
+    )
+    break_even = np.where(behind[:, -1], np.nan, last_behind + 1.0)
+    return {"buy": buy, "rent": renter, "break_even": break_even}
+
+
+# ---------------- Portfolio ----------------
+PORTFOLIO_PRIORITIES = ("Highest rate", "Smallest balance", "Listed order")
+PORTFOLIO_COLUMNS = (
+    "Property",
+    "Month",
+    "P&I",
+    "Tax",
+    "TotalPayment",
+    "Balance",
+    "RecastAmount",
+    "MonthlyInterest",
+)
+
+
+def simulate_portfolio(
+    scenarios,
+    initial_cash=0,
+    surplus=0,
+    buffer_cash=0,
+    priority="Highest rate",
+    months=None,
+):
+    """Several loans recast from one shared savings pool.
+
+    Each build_scenario() dict brings its own loan, taxes, insurance and
+    recast policy (method, recast_int, lump); its savings settings are
+    replaced by the pool's. The pool gains ``surplus`` every month while any
+    loan is open, and at each loan's recast months it funds the due loans in
+    ``priority`` order, keeping ``buffer_cash`` back for savings-based recasts.
+    All loans are stepped together as arrays, one month at a time.
+
+    Returns (loans, totals): a long DataFrame of PORTFOLIO_COLUMNS (Property
+    is the position in ``scenarios``) and a per-month DataFrame of
+    TotalPayment, Balance, RecastAmount and SavingsBalance across the
+    portfolio.
+    """
+    if priority not in PORTFOLIO_PRIORITIES:
+        raise ValueError(f"priority must be one of {PORTFOLIO_PRIORITIES}")
+    b = scenario_arrays(scenarios)
+    term, r = b["term_mo"], b["r_mo"]
+    horizon = int(term.max()) if months is None else min(int(months), int(term.max()))
+    monthly_taxes, monthly_ins = escalation_arrays(b, horizon)
+    rates, closing_costs = monthly_rates(r, b["rate_events"], horizon)
+    n = len(scenarios)
+    columns = PORTFOLIO_COLUMNS[2:]
+    state = {col: np.full((n, horizon), np.nan) for col in columns}
+    pool = np.empty(horizon)
+
+    balance = b["loan"].copy()
+    p_i = payment_array(balance, term, r)
+    savings = float(initial_cash)
+    for m in range(1, horizon + 1):
+        live = m <= term
+        changed = rates[:, m - 1] != r
+        r = rates[:, m - 1]
+        p_i = np.where(
+            changed & (balance > 0), payment_array(balance, term - m + 1, r), p_i
+        )
+        closing = np.where(balance > 0, closing_costs[:, m - 1], 0.0)
+        open_ = balance > 0
+        interest = np.where(open_, balance * r, 0.0)
+        balance = np.where(open_, balance - (p_i - interest), balance)
+        paid = np.where(balance > 0, p_i, 0.0)
+
+        recast_amount = np.zeros(n)
+        if (balance > 0).any():
+            savings += surplus
+        due = live & (balance > 0) & (m % b["recast_int"] == 0)
+        if due.any():
+            if priority == "Highest rate":
+                order = np.argsort(-r, kind="stable")
+            elif priority == "Smallest balance":
+                order = np.argsort(balance, kind="stable")
+            else:
+                order = np.arange(n)
+            # Sequential on purpose: each recast shrinks the pool for the next loan
+            for i in order[due[order]]:
+                if b["savings_based"][i]:
+                    amount = min(max(0.0, savings - buffer_cash), balance[i])
+                elif b["lump"][i] > 0 and savings >= b["lump"][i]:
+                    amount = min(b["lump"][i], balance[i])
+                else:
+                    continue
+                if amount > 0:
+                    recast_amount[i] = amount
+                    balance[i] -= amount
+                    savings -= amount
+                    p_i[i] = (
+                        0.0
+                        if balance[i] <= 0
+                        else payment(balance[i], term[i] - m, r[i])
+                    )
+
+        costs = monthly_taxes[:, m - 1] + monthly_ins[:, m - 1] + closing
+        month = {
+            "P&I": np.where(balance > 0, p_i, 0.0),
+            "Tax": monthly_taxes[:, m - 1],
+            "TotalPayment": paid + costs,
+            "Balance": balance,
+            "RecastAmount": recast_amount,
+            "MonthlyInterest": interest,
+        }
+        for col in columns:
+            state[col][live, m - 1] = month[col][live]
+        pool[m - 1] = savings
+
+    loans = long_frame(state, ("Month",) + columns).rename(
+        columns={"Scenario": "Property"}
+    )
+    totals = pd.DataFrame(
+        {
+            "Month": np.arange(1, horizon + 1),
+            "TotalPayment": np.nansum(state["TotalPayment"], axis=0),
+            "Balance": np.nansum(state["Balance"], axis=0),
+            "RecastAmount": np.nansum(state["RecastAmount"], axis=0),
+            "SavingsBalance": pool,
+        }
+    )
+    return loans, totals
@@ -0,0 +1,68 @@
+"""Background precomputation of likely-next scenarios into a ScenarioCache."""
+
+import os
+import queue
+import threading
+import time
+
+from cachetools import LRUCache
+
+
+class Prefetcher:
+    """Single low-priority worker that warms a ScenarioCache.
+
+    Each owner (a browser session) has at most one live batch of jobs: a new
+    submit() cancels whatever that owner queued before. The queue is bounded
+    and full queues drop work, and the worker sleeps after every job so that it
+    uses at most ``cpu_budget`` of one core. The compiled recast kernel
+    releases the GIL, so a prefetch job does not stall a foreground rerun.
+    """
+
+    def __init__(self, cache, max_queue=32, cpu_budget=0.25):
+        self.cache = cache
+        self.cpu_budget = cpu_budget
+        self._jobs = queue.Queue(maxsize=max_queue)
+        self._generations = LRUCache(maxsize=4096)
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def submit(self, owner, scenarios, horizons=(None,)):
+        """Queue scenarios at each horizon (None is the full term) for ``owner``"""
+        with self._lock:
+            generation = self._generations.get(owner, 0) + 1
+            self._generations[owner] = generation
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="scenario-prefetch", daemon=True
+                )
+                self._worker.start()
+        jobs = [(scenario, months) for scenario in scenarios for months in horizons]
+        for scenario, months in jobs:
+            try:
+                self._jobs.put_nowait((owner, generation, scenario, months))
+            except queue.Full:
+                break  # speculative work is optional; never block a rerun
+
+    def cancel(self, owner):
+        with self._lock:
+            self._generations[owner] = self._generations.get(owner, 0) + 1
+
+    def _run(self):
+        try:
+            # Linux schedules threads individually, so this lowers only the worker
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            owner, generation, scenario, months = self._jobs.get()
+            with self._lock:
+                stale = self._generations.get(owner) != generation
+            if stale or self.cache.get(dict(scenario, months=months)) is not None:
+                continue
+            started = time.perf_counter()
+            try:
+                self.cache.schedules(scenario, months)
+            except Exception:
+                continue  # e.g. an out-of-range neighbour; the foreground will report it
+            elapsed = time.perf_counter() - started
+            time.sleep(elapsed * (1 - self.cpu_budget) / self.cpu_budget)
@@ -0,0 +1,145 @@
+"""Compiled month loop for recasting (optional numba dependency).
+
+Savings-based recasts depend on the savings balance at every recast boundary,
+so the amortization cannot be vectorized over time. With numba installed the
+loop below is compiled to machine code; without it,
+mortgage.py uses its pure-Python and NumPy engines instead.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+
+    HAVE_NUMBA = True
+except ImportError:  # numba is optional
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """Stand-in that leaves the kernels as plain Python functions"""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+# Per-month outputs of amortize(), in order
+STATE_COLUMNS = (
+    "MonthlyInterest",
+    "PaidPI",  # P&I actually paid this month (0 once the loan is gone)
+    "P&I",  # P&I going forward, after any recast
+    "Balance",
+    "RecastAmount",
+    "SavingsBalance",
+    "NoRecastPaidPI",
+    "NoRecastBalance",
+)
+
+
+@njit(cache=True, error_model="numpy", nogil=True)
+def amortize(
+    loan,
+    rates,
+    term_mo,
+    months,
+    savings_based,
+    recast_int,
+    initial_cash,
+    surplus,
+    buffer_cash,
+    lump,
+    out,
+):
+    """Step one scenario through ``months`` months, writing rows of ``out`` (8, >=months).
+
+    ``rates`` holds the monthly rate of each month.
+    """
+    balance = loan
+    r_mo = rates[0]
+    # Float exponents so numba calls pow() like CPython instead of repeated multiplies
+    p_i = loan * r_mo / (1 - (1 + r_mo) ** -float(term_mo))
+    savings = initial_cash
+    balance0 = loan
+    p_i0 = p_i
+
+    for i in range(months):
+        m = i + 1
+        if rates[i] != r_mo:
+            # A rate change re-amortizes both tracks over the rest of the term
+            r_mo = rates[i]
+            if balance > 0:
+                p_i = balance * r_mo / (1 - (1 + r_mo) ** -float(term_mo - i))
+            if balance0 > 0:
+                p_i0 = balance0 * r_mo / (1 - (1 + r_mo) ** -float(term_mo - i))
+        interest = 0.0
+        if balance > 0:
+            interest = balance * r_mo
+            balance -= p_i - interest
+        paid = p_i if balance > 0 else 0.0
+
+        recast_amount = 0.0
+        if balance > 0:
+            savings += surplus
+            if m % recast_int == 0:
+                if savings_based:
+                    recast_amount = min(max(0.0, savings - buffer_cash), balance)
+                elif lump > 0 and savings >= lump:
+                    recast_amount = min(lump, balance)
+            if recast_amount > 0:
+                balance -= recast_amount
+                savings -= recast_amount
+                if balance <= 0:
+                    p_i = 0.0
+                else:
+                    p_i = balance * r_mo / (1 - (1 + r_mo) ** -float(term_mo - m))
+
+        if balance0 > 0:
+            balance0 -= p_i0 - balance0 * r_mo
+
+        out[0, i] = interest
+        out[1, i] = paid
+        out[2, i] = p_i if balance > 0 else 0.0
+        out[3, i] = balance
+        out[4, i] = recast_amount
+        out[5, i] = savings
+        out[6, i] = p_i0 if balance0 > 0 else 0.0
+        out[7, i] = balance0
+
+
+# Not parallel=True: Streamlit calls in from many script threads at once and
+# numba's parallel backends are not safe (or hang at exit) under that use.
+# nogil lets those threads (and the background prefetcher) run kernels side by
+# side instead of queueing on the GIL.
+@njit(cache=True, error_model="numpy", nogil=True)
+def amortize_batch(
+    loan,
+    rates,
+    term_mo,
+    horizon,
+    savings_based,
+    recast_int,
+    initial_cash,
+    surplus,
+    buffer_cash,
+    lump,
+):
+    """amortize() for N scenarios; returns a float64 (8, N, horizon) array.
+
+    ``rates`` is (N, >=horizon). Months past a scenario's term are NaN.
+    """
+    n = loan.shape[0]
+    out = np.full((len(STATE_COLUMNS), n, horizon), np.nan)
+    for j in range(n):
+        amortize(
+            loan[j],
+            rates[j],
+            term_mo[j],
+            min(horizon, term_mo[j]),
+            savings_based[j],
+            recast_int[j],
+            initial_cash[j],
+            surplus[j],
+            buffer_cash[j],
+            lump[j],
+            out[:, j, :],
+        )
+    return out
@@ -0,0 +1,323 @@
+"""Store of simulated schedules keyed by a hash of the engine inputs.
+
+ScenarioCache is an in-process LRU; an optional DiskCache behind it keeps
+results in SQLite so they survive restarts and are shared between processes.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import pyarrow as pa
+from cachetools import LRUCache
+
+from mortgage import ENGINE_VERSION, run_scenario, simulate_batch
+
+logger = logging.getLogger(__name__)
+
+
+def scenario_key(scenario):
+    """Stable hash of a build_scenario() dict (independent of key order).
+
+    Floats are rounded to 12 significant digits so that 6.65 and a stepper's
+    6.6499999999999995 share an entry.
+    """
+    normalized = {
+        key: float(f"{value:.12g}") if isinstance(value, float) else value
+        for key, value in scenario.items()
+    }
+    normalized["engine_version"] = ENGINE_VERSION
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()[:32]
+
+
+class ScenarioCache:
+    """Thread-safe LRU of run_scenario() results shared by every session.
+
+    Concurrent requests for the same scenario (e.g. a popular shared link) wait
+    for the first one to finish instead of all computing it. With a ``disk``
+    cache, misses are looked up there before computing and new results are
+    written through to it.
+    """
+
+    def __init__(self, maxsize=256, disk=None):
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.disk = disk
+
+    def get(self, scenario):
+        return self._lookup(scenario_key(scenario))
+
+    def put(self, scenario, result):
+        self._store(scenario_key(scenario), result)
+
+    def _lookup(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+        if self.disk is not None:
+            if result is not None:
+                self.disk.touch(key)
+            else:
+                result = self.disk.get(key)
+                if result is not None:
+                    with self._lock:
+                        self._entries[key] = result
+        return result
+
+    def _store(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+        if self.disk is not None:
+            self.disk.put(key, result)
+
+    def get_or_compute(self, scenario, compute):
+        key = scenario_key(scenario)
+        with self._lock:
+            result = self._entries.get(key)
+            pending = self._pending.get(key)
+            owner = result is None and pending is None
+            if owner:
+                pending = self._pending[key] = threading.Event()
+        if result is not None:
+            # Served from memory, but the disk copy must not look stale to eviction
+            if self.disk is not None:
+                self.disk.touch(key)
+            return result
+
+        if not owner:
+            pending.wait()
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+            # The owner failed (or the entry was already evicted); compute it here
+            return compute(scenario)
+
+        try:
+            result = self.disk.get(key) if self.disk is not None else None
+            if result is None:
+                result = compute(scenario)
+                if self.disk is not None:
+                    self.disk.put(key, result)
+            with self._lock:
+                self._entries[key] = result
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def schedules(self, scenario, months=None):
+        """run_scenario() for a scenario, simulated only to ``months`` when given"""
+        return self.get_or_compute(
+            dict(scenario, months=months), lambda key: run_scenario(scenario, months)
+        )
+
+    def schedules_many(self, scenarios, months=None):
+        """schedules() for a list of scenarios, simulating every miss in one batch"""
+        keys = [scenario_key(dict(s, months=months)) for s in scenarios]
+        results = [self._lookup(key) for key in keys]
+        # Each distinct missing scenario is simulated once, however often repeated
+        missing = {}
+        for i, result in enumerate(results):
+            if result is None:
+                missing.setdefault(keys[i], []).append(i)
+        if not missing:
+            return results
+        batch = [scenarios[positions[0]] for positions in missing.values()]
+        groups = [
+            dict(list(frame.groupby("Scenario")))
+            for frame in simulate_batch(batch, months)
+        ]
+        for n, (key, positions) in enumerate(missing.items()):
+            result = tuple(
+                group[n].drop(columns="Scenario").reset_index(drop=True)
+                for group in groups
+            )
+            self._store(key, result)
+            for i in positions:
+                results[i] = result
+        return results
+
+
+def frames_to_bytes(frames):
+    """Serialize a tuple of DataFrames as Arrow IPC streams"""
+    blobs = []
+    for frame in frames:
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+        blobs.append(sink.getvalue().to_pybytes())
+    return blobs
+
+
+def frames_from_bytes(blobs):
+    return tuple(pa.ipc.open_stream(blob).read_pandas() for blob in blobs)
+
+
+class DiskCache:
+    """SQLite file of run_scenario() results shared by every worker process.
+
+    Writes are single transactions in WAL mode, so a crash mid-write leaves
+    the previous state intact; unreadable entries count as misses and are
+    dropped, and an unreadable database file is moved aside and recreated.
+    When the stored results exceed ``max_bytes`` the least recently used are
+    evicted. Hits served from a ScenarioCache's memory are reported with
+    touch(), and their access times written in batches at most every
+    ``touch_interval`` seconds (and before any eviction).
+    """
+
+    def __init__(self, path, max_bytes=512 * 2**20, touch_interval=60, timeout=10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.timeout = timeout
+        self._touches = {}
+        self._touched = time.monotonic()
+        self._touch_lock = threading.Lock()
+        self._local = threading.local()
+        try:
+            self._setup()
+        except sqlite3.DatabaseError:
+            logger.warning("Cache %s is unreadable; starting a new one", path)
+            os.replace(path, f"{path}.corrupt")
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            self._local = threading.local()
+            self._setup()
+
+    def _connect(self):
+        # One connection per thread, and never one inherited across a fork
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _setup(self):
+        conn = self._connect()
+        conn.execute("PRAGMA quick_check")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schedules ("
+            " key TEXT PRIMARY KEY, recast BLOB, no_recast BLOB,"
+            " size INTEGER, accessed REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS lru ON schedules (accessed)")
+
+    def get(self, key):
+        try:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT recast, no_recast FROM schedules WHERE key = ?", (key,)
+                )
+                .fetchone()
+            )
+        except sqlite3.Error:
+            # e.g. locked by another worker: a miss, but the entry stays
+            logger.warning("Could not read cache entry %s", key, exc_info=True)
+            return None
+        if row is None:
+            return None
+        try:
+            result = frames_from_bytes(row)
+        except pa.ArrowException:
+            logger.warning("Dropping unreadable cache entry %s", key, exc_info=True)
+            self._discard(key)
+            return None
+        self.touch(key)
+        return result
+
+    def touch(self, key):
+        """Mark ``key`` as just used; written out once ``touch_interval`` has passed"""
+        with self._touch_lock:
+            self._touches[key] = time.time()
+            if time.monotonic() - self._touched < self.touch_interval:
+                return
+        try:
+            self._write_touches(self._connect())
+        except sqlite3.Error:
+            # Recency is advisory; the touches are retried with the next batch
+            logger.warning("Could not record cache access times", exc_info=True)
+
+    def _write_touches(self, conn):
+        with self._touch_lock:
+            touches, self._touches = self._touches, {}
+            self._touched = time.monotonic()
+        try:
+            conn.executemany(
+                "UPDATE schedules SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in touches.items()],
+            )
+        except sqlite3.Error:
+            with self._touch_lock:
+                for key, accessed in touches.items():
+                    self._touches.setdefault(key, accessed)
+            raise
+
+    def put(self, key, result):
+        recast, no_recast = frames_to_bytes(result)
+        size = len(recast) + len(no_recast)
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO schedules VALUES (?, ?, ?, ?, ?)",
+                    (key, recast, no_recast, size, time.time()),
+                )
+                # Pending touches first, so eviction sees what is really in use
+                self._write_touches(conn)
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            # The in-memory cache still has the result; persisting is best effort
+            logger.warning("Could not persist cache entry %s", key, exc_info=True)
+
+    def _evict(self, conn):
+        (total,) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM schedules"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so eviction isn't repeated on every insert
+        excess = total - int(self.max_bytes * 0.9)
+        stale = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM schedules ORDER BY accessed"
+        ):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        conn.executemany("DELETE FROM schedules WHERE key = ?", stale)
+
+    def _discard(self, key):
+        try:
+            self._connect().execute("DELETE FROM schedules WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+
+def open_disk_cache():
+    """DiskCache in $HOUSESIM_CACHE_DIR (a mounted volume), or None when unset"""
+    directory = os.environ.get("HOUSESIM_CACHE_DIR")
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    max_mb = int(os.environ.get("HOUSESIM_CACHE_MB", "512"))
+    return DiskCache(os.path.join(directory, "schedules.sqlite"), max_mb * 2**20)
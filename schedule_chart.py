@@ -0,0 +1,104 @@
+"""Monthly payment and cumulative cost charts drawn in the browser.
+
+The full-term schedule is sent once as base64 little-endian typed arrays;
+the horizon slider, tax refund and recast marker toggles (and Plotly's legend
+toggles) then redraw client-side without a Streamlit rerun.
+"""
+
+import base64
+import hashlib
+import os
+
+import numpy as np
+import plotly
+import streamlit.components.v1 as components
+
+from export import schedule_table
+
+FRONTEND = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "schedule_chart_frontend"
+)
+
+
+def bundle_plotly_js():
+    """Copy the installed plotly package's plotly.min.js next to index.html.
+
+    The component then loads the same Plotly.js as the server-side figures,
+    from the app's own origin instead of a CDN.
+    """
+    source = os.path.join(
+        os.path.dirname(plotly.__file__), "package_data", "plotly.min.js"
+    )
+    target = os.path.join(FRONTEND, "plotly.min.js")
+    if os.path.exists(target) and os.path.getsize(target) == os.path.getsize(source):
+        return
+    # Written aside and renamed, so a browser never fetches half a file
+    partial = f"{target}.{os.getpid()}"
+    with open(source, "rb") as src, open(partial, "wb") as dst:
+        dst.write(src.read())
+    os.replace(partial, target)
+
+
+bundle_plotly_js()
+_component = components.declare_component("schedule_chart", path=FRONTEND)
+
+# schedule_table() columns sent to the browser; Month as uint16, the rest float32
+PAYLOAD_COLUMNS = (
+    "Month",
+    "TotalPayment",
+    "EffectivePayment",
+    "P&I",
+    "Tax",
+    "MonthlyTaxBenefit",
+    "RecastAmount",
+    "CumulativePaid",
+    "Balance",
+    "NoRecastCumulativePaid",
+)
+
+
+def encode_array(values, dtype):
+    return {
+        "dtype": dtype,
+        "data": base64.b64encode(
+            np.asarray(values).astype(f"<{dtype}").tobytes()
+        ).decode(),
+    }
+
+
+def schedule_payload(df, df_no_recast, overlays=()):
+    """Columnar payload of a schedule plus optional (name, df) comparison overlays"""
+    table = schedule_table(df, df_no_recast)
+    columns = {
+        col: encode_array(table[col].to_numpy(), "u2" if col == "Month" else "f4")
+        for col in PAYLOAD_COLUMNS
+    }
+    payload = {
+        "length": table.num_rows,
+        "columns": columns,
+        "overlays": [
+            {
+                "name": name,
+                "Month": encode_array(rows["Month"], "u2"),
+                "TotalPayment": encode_array(rows["TotalPayment"], "f4"),
+                "EffectivePayment": encode_array(rows["EffectivePayment"], "f4"),
+                "CumulativePaid": encode_array(rows["CumulativePaid"], "f4"),
+            }
+            for name, rows in overlays
+        ],
+    }
+    # Lets the browser skip decoding when a rerun resends the same schedule
+    digest = hashlib.sha256(repr(payload).encode()).hexdigest()[:16]
+    return dict(payload, id=digest)
+
+
+def schedule_chart(payload, horizon, include_tax_refund, colors, key=None):
+    """Render the charts; ``horizon`` and ``include_tax_refund`` are the initial view"""
+    return _component(
+        payload=payload,
+        horizon=int(horizon),
+        include_tax_refund=bool(include_tax_refund),
+        colors=colors,
+        key=key,
+        default=None,
+    )
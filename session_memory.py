@@ -0,0 +1,179 @@
+"""Per-session memory accounting and idle-worker recycling.
+
+Every rerun reports what it built (schedules, figures) and what its session
+state holds. A background thread drops sessions that have gone idle from the
+ledger and, past an optional RSS limit, logs the largest sessions and recycles
+the worker process once no session is active, or after a drain deadline if
+sessions stay busy. Streamlit itself discards the state of sessions whose tab
+has disconnected (``server.disconnectedSessionTTL``); inputs live in the URL,
+so a tab that reconnects to a recycled worker simply rebuilds.
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from plotly.basedatatypes import BaseFigure
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger(__name__)
+
+
+def memory_size(obj, seen=None):
+    """Approximate bytes held by ``obj``, following containers and arrays"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True, index=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, pa.Table):
+        return obj.nbytes
+    if isinstance(obj, BaseFigure):
+        # The raw trace and layout dicts; to_plotly_json() would copy them all
+        return memory_size((obj._data, obj._layout), seen)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(memory_size(k, seen) + memory_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(memory_size(item, seen) for item in obj)
+    return size
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def current_session_id():
+    """Id of the browser session whose script run is calling this"""
+    return get_script_run_ctx().session_id
+
+
+class SessionMonitor:
+    """Memory ledger of browser sessions, with idle-worker recycling.
+
+    record() is called by the script thread at the end of every rerun; sizes
+    replace the previous rerun's, since objects built by a rerun are garbage
+    once it finishes. The monitor only reads what it is given and never
+    touches Streamlit's session objects. A session not seen for
+    ``idle_seconds`` is dropped from the ledger. With ``recycle_mb`` set, a
+    worker whose RSS exceeds it exits (SIGTERM, for the container's restart
+    policy to start a fresh one) as soon as no session is active, so nobody
+    is mid-use when it goes. A worker that never goes quiet exits anyway once
+    it has been over the limit for ``drain_seconds``.
+    """
+
+    def __init__(self, idle_seconds=1800, recycle_mb=0, drain_seconds=900, interval=60):
+        self.idle_seconds = idle_seconds
+        self.recycle_bytes = recycle_mb * 2**20
+        self.drain_seconds = drain_seconds
+        self.interval = interval
+        self.over_limit_since = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def record(self, session_id, **objects):
+        """Sizes of this rerun's ``objects`` (including its session state) by category"""
+        sizes = {category: memory_size(value) for category, value in objects.items()}
+        with self._lock:
+            self._sessions[session_id] = {
+                "sizes": sizes,
+                "last_seen": time.monotonic(),
+            }
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="session-monitor", daemon=True
+                )
+                self._worker.start()
+
+    def usage(self):
+        """{session_id: {category: bytes, ..., "idle_seconds": s}} for active sessions"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                session_id: dict(
+                    entry["sizes"], idle_seconds=round(now - entry["last_seen"])
+                )
+                for session_id, entry in self._sessions.items()
+            }
+
+    def largest(self, n=5):
+        """The ``n`` sessions holding the most tracked bytes, as (session_id, bytes)"""
+        with self._lock:
+            totals = [
+                (session_id, sum(entry["sizes"].values()))
+                for session_id, entry in self._sessions.items()
+            ]
+        return sorted(totals, key=lambda total: total[1], reverse=True)[:n]
+
+    def check(self, now=None):
+        """Drop idle sessions from the ledger; returns True to recycle the worker"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for session_id, entry in list(self._sessions.items()):
+                if now - entry["last_seen"] >= self.idle_seconds:
+                    del self._sessions[session_id]
+            active = len(self._sessions)
+            tracked = sum(sum(e["sizes"].values()) for e in self._sessions.values())
+
+        rss = rss_bytes()
+        logger.debug("%d sessions, %d tracked bytes, RSS %s", active, tracked, rss)
+        if not self.recycle_bytes or rss is None or rss <= self.recycle_bytes:
+            self.over_limit_since = None
+            return False
+        if self.over_limit_since is None:
+            logger.warning(
+                "RSS %d MB is over the %d MB limit; recycling once sessions are idle"
+                " or in %d minutes. Largest sessions: %s",
+                rss // 2**20,
+                self.recycle_bytes // 2**20,
+                self.drain_seconds // 60,
+                ", ".join(
+                    f"{sid} {size / 2**20:.1f} MB" for sid, size in self.largest()
+                )
+                or "none",
+            )
+            self.over_limit_since = now
+        if active and now - self.over_limit_since < self.drain_seconds:
+            return False
+        if active:
+            logger.warning("Drain deadline passed with %d sessions active", active)
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                recycle = self.check()
+            except Exception:  # accounting must never take the worker down
+                logger.exception("Session monitor check failed")
+                continue
+            if recycle:
+                logger.warning("Recycling worker process %d", os.getpid())
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+
+def monitor_from_env():
+    """SessionMonitor configured by the HOUSESIM_*_MINUTES and _MB variables"""
+    return SessionMonitor(
+        idle_seconds=float(os.environ.get("HOUSESIM_IDLE_MINUTES", "30")) * 60,
+        recycle_mb=int(os.environ.get("HOUSESIM_RECYCLE_MB", "0")),
+        drain_seconds=float(os.environ.get("HOUSESIM_DRAIN_MINUTES", "15")) * 60,
+    )
@@ -0,0 +1,231 @@
+"""Compact output for very large batched sweeps.
+
+simulate_arrays() returns float64 (N, M) arrays for every schedule column,
+which for millions of scenarios over 480 months runs to tens of GB. run_sweep()
+simulates in chunks and keeps only the requested columns, as float32 or as
+int32 cents, optionally reduced to one value per loan year. Each column is
+written into a memory-mapped .npy file as the chunks finish, so memory use is
+bounded by the chunk size rather than the sweep size:
+
+    python sweep.py inputs.parquet out/ --columns Balance TotalPayment --yearly
+"""
+
+import argparse
+import json
+import os
+from collections.abc import Sequence
+
+import numpy as np
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from mortgage import NO_RECAST_COLUMNS, RECAST_COLUMNS, build_scenario, simulate_arrays
+
+COMPACT_DTYPES = ("float32", "cents")
+# Every simulate_arrays() column; no-recast ones prefixed as in schedule_table()
+SWEEP_COLUMNS = tuple(c for c in RECAST_COLUMNS if c not in ("Month", "IsPaidOff"))
+SWEEP_COLUMNS += tuple(
+    f"NoRecast{c}" for c in NO_RECAST_COLUMNS if c not in ("Month", "Tax", "IsPaidOff")
+)
+DEFAULT_COLUMNS = ("TotalPayment", "Balance", "CumulativePaid")
+# Summed over each year in yearly mode; the other columns keep the year-end value
+FLOW_COLUMNS = (
+    "Tax",
+    "TotalPayment",
+    "RecastAmount",
+    "MonthlyInterest",
+    "MonthlyTaxBenefit",
+    "EffectivePayment",
+    "NoRecastTotalPayment",
+)
+# int32 cents cover amounts up to $21.4M; months past a term hold this value
+MISSING_CENTS = int(np.iinfo(np.int32).min)
+META_FILE = "sweep.json"
+
+
+def yearly_values(values, column):
+    """(N, M) monthly values -> (N, years): year totals for flows, else year-end"""
+    n, months = values.shape
+    years = -(-months // 12)
+    padded = np.full((n, years * 12), np.nan)
+    padded[:, :months] = values
+    padded = padded.reshape(n, years, 12)
+    live = ~np.isnan(padded)
+    if column in FLOW_COLUMNS:
+        return np.where(live.any(axis=2), np.nansum(padded, axis=2), np.nan)
+    # Last month paid in each year, which is not month 12 for a partial horizon
+    last = 11 - np.argmax(live[:, :, ::-1], axis=2)
+    return np.take_along_axis(padded, last[:, :, None], axis=2)[:, :, 0]
+
+
+def encode(values, dtype):
+    """float64 dollars (NaN = no such month) -> stored float32 or int32 cents"""
+    if dtype == "float32":
+        return values.astype(np.float32)
+    cents = np.round(values * 100)
+    missing = np.isnan(cents)
+    if np.any(np.abs(cents[~missing]) > np.iinfo(np.int32).max):
+        raise ValueError("amounts over $21.4M do not fit in int32 cents; use float32")
+    return np.where(missing, MISSING_CENTS, cents).astype(np.int32)
+
+
+def decode(values):
+    """Stored column -> float64 dollars with NaN for missing months"""
+    if values.dtype == np.int32:
+        return np.where(values == MISSING_CENTS, np.nan, values / 100)
+    return values.astype(np.float64)
+
+
+def run_sweep(
+    scenarios,
+    directory,
+    columns=DEFAULT_COLUMNS,
+    dtype="float32",
+    yearly=False,
+    months=None,
+    chunk_size=2_000,
+):
+    """Simulate build_scenario() dicts chunk by chunk into compact column files.
+
+    ``scenarios`` is a sequence (it is sliced into chunks; see ScenarioRows
+    for building them lazily from a table). Writes ``<column>.npy`` of shape
+    (N, periods) for each of ``columns`` plus sweep.json describing the
+    layout, and returns that description. Read the results back with
+    open_sweep().
+    """
+    unknown = set(columns) - set(SWEEP_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(sorted(unknown))}")
+    if dtype not in COMPACT_DTYPES:
+        raise ValueError(f"dtype must be one of {COMPACT_DTYPES}")
+    n = len(scenarios)
+    if n == 0:
+        raise ValueError("a sweep needs at least one scenario")
+
+    horizon = max_term_mo(scenarios)
+    if months is not None:
+        horizon = min(int(months), horizon)
+    periods = -(-horizon // 12) if yearly else horizon
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        col: np.lib.format.open_memmap(
+            os.path.join(directory, f"{col}.npy"),
+            mode="w+",
+            dtype=np.float32 if dtype == "float32" else np.int32,
+            shape=(n, periods),
+        )
+        for col in columns
+    }
+
+    for start in range(0, n, chunk_size):
+        chunk = scenarios[start : start + chunk_size]
+        out, out_base = simulate_arrays(chunk, horizon)
+        arrays = dict(out, **{f"NoRecast{c}": v for c, v in out_base.items()})
+        for col in columns:
+            # A chunk of shorter terms comes back narrower than the sweep
+            values = np.full((len(chunk), horizon), np.nan)
+            values[:, : arrays[col].shape[1]] = arrays[col]
+            if yearly:
+                values = yearly_values(values, col)
+            files[col][start : start + len(chunk)] = encode(values, dtype)
+    for memmap in files.values():
+        memmap.flush()
+
+    meta = {
+        "count": n,
+        "columns": list(columns),
+        "dtype": dtype,
+        "period": "year" if yearly else "month",
+        "periods": periods,
+        "months": horizon,
+    }
+    if dtype == "cents":
+        meta["missing"] = MISSING_CENTS
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def max_term_mo(scenarios):
+    """Longest term in months; read off the term_years column for a ScenarioRows"""
+    if isinstance(scenarios, ScenarioRows):
+        # No pass converting every row to a scenario just to size the output
+        return int(pc.max(scenarios.table["term_years"]).as_py()) * 12
+    return max(int(s["term_mo"]) for s in scenarios)
+
+
+def open_sweep(directory):
+    """(meta, {column: read-only memory-mapped array}) for a run_sweep() directory"""
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    columns = {
+        col: np.load(os.path.join(directory, f"{col}.npy"), mmap_mode="r")
+        for col in meta["columns"]
+    }
+    return meta, columns
+
+
+class ScenarioRows(Sequence):
+    """Rows of a table of build_scenario() arguments, converted when indexed.
+
+    Keeps a sweep's inputs as compact Arrow columns instead of millions of
+    scenario dicts; null cells fall back to build_scenario() defaults.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = np.arange(*index.indices(len(self)))
+            rows = self.table.take(indices).to_pylist()
+            return [self._scenario(row) for row in rows]
+        if not -len(self) <= index < len(self):
+            raise IndexError("scenario index out of range")
+        return self._scenario(self.table.slice(index % len(self), 1).to_pylist()[0])
+
+    @staticmethod
+    def _scenario(row):
+        return build_scenario(**{k: v for k, v in row.items() if v is not None})
+
+
+def read_inputs(path):
+    """Parquet or CSV file of build_scenario() arguments, one scenario per row"""
+    if path.endswith(".csv"):
+        return ScenarioRows(pv.read_csv(path))
+    return ScenarioRows(pq.read_table(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", help="Parquet or CSV of build_scenario() arguments")
+    parser.add_argument("directory", help="output directory for the column files")
+    parser.add_argument(
+        "--columns", nargs="+", default=DEFAULT_COLUMNS, choices=SWEEP_COLUMNS
+    )
+    parser.add_argument("--dtype", default="float32", choices=COMPACT_DTYPES)
+    parser.add_argument(
+        "--yearly", action="store_true", help="one value per loan year, not per month"
+    )
+    parser.add_argument("--months", type=int, help="stop after this many months")
+    parser.add_argument("--chunk-size", type=int, default=2_000)
+    args = parser.parse_args()
+
+    meta = run_sweep(
+        read_inputs(args.inputs),
+        args.directory,
+        args.columns,
+        args.dtype,
+        args.yearly,
+        args.months,
+        args.chunk_size,
+    )
+    print(json.dumps(meta))
+
+
+if __name__ == "__main__":
+    main()
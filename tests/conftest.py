@@ -0,0 +1,10 @@
+"""Hypothesis profiles; set HYPOTHESIS_PROFILE=thorough for a longer search"""
+
+import os
+
+from hypothesis import settings
+
+# No per-example deadline: the first numba call compiles the kernel
+settings.register_profile("dev", deadline=None)
+settings.register_profile("thorough", deadline=None, max_examples=2_000)
+settings.load_profile(os.environ.get("HYPOTHESIS_PROFILE", "dev"))
@@ -0,0 +1,283 @@
+"""Reference oracle: the original month-by-month loops of house_sim.py.
+
+simulate() and simulate_no_recast() are kept as first written, except that the
+Streamlit globals they read are now arguments. Deductions are totalled per tax
+year, as the engine has done since it stopped evaluating them month by month,
+using the scalar calculate_tax_benefit(), and the later escalation models and
+rate changes are evaluated inline each month like the original property tax.
+Nothing here is optimized; every faster engine in mortgage.py is tested against it.
+"""
+
+import pandas as pd
+
+from mortgage import calculate_tax_benefit, payment
+
+
+def escalated(tax, ins, m, tax_appreciation, tax_escalation, tax_cap, ins_inflation):
+    """Property tax and insurance for month m"""
+    if tax_escalation == "Compound":
+        current_tax = tax * (1 + tax_appreciation / 100) ** (m / 12)
+    else:  # raised on each loan anniversary, by no more than the cap
+        step = min(tax_appreciation, tax_cap)
+        current_tax = tax * (1 + step / 100) ** ((m - 1) // 12)
+    current_ins = ins * (1 + ins_inflation / 100) ** ((m - 1) // 12)
+    return current_tax, current_ins
+
+
+def rate_change(event, balance, p_i, r_mo, term_mo, m):
+    """(P&I, monthly rate, closing costs) after a month's rate event, if any"""
+    if event is None or balance <= 0:
+        return p_i, r_mo, 0
+    r_mo = event["rate"] / 100 / 12
+    return payment(balance, term_mo - m + 1, r_mo), r_mo, event["closing_costs"]
+
+
+def tax_year_benefits(interest, taxes, income, loan, start_month=1):
+    """Benefit per month: each tax year's deduction spread over its months"""
+    if income <= 0:
+        return [0] * len(interest)
+    years = {}
+    for m, (month_interest, month_tax) in enumerate(zip(interest, taxes), start=1):
+        year = (m + start_month - 2) // 12
+        years.setdefault(year, []).append((month_interest, month_tax))
+
+    benefits = []
+    for months in years.values():
+        yearly_interest = sum(i for i, _ in months)
+        yearly_tax = sum(t for _, t in months)
+        # calculate_tax_benefit() takes the average monthly property tax
+        benefit = calculate_tax_benefit(yearly_interest, yearly_tax / 12, income, loan)
+        benefits += [benefit / len(months)] * len(months)
+    return benefits
+
+
+def simulate(
+    term_mo,
+    r_mo,
+    tax,
+    ins,
+    loan,
+    tax_appreciation=0.0,
+    method="Savings-based",
+    recast_int=12,
+    initial_cash=0,
+    surplus=0,
+    buffer_cash=0,
+    lump=0,
+    benefit_income=0,
+    start_month=1,
+    tax_escalation="Compound",
+    tax_cap=2.0,
+    ins_inflation=0.0,
+    rate_events=(),
+):
+    balance = loan
+    p_i = payment(balance, term_mo, r_mo)
+    savings = initial_cash  # Start with initial cash
+    cum_paid = 0
+    cum_recast = 0
+    rows = []
+    by_month = {event["month"]: event for event in rate_events}
+
+    # Continue to term_mo even after loan is paid, for tax/insurance
+    for m in range(1, term_mo + 1):
+        # Calculate appreciated property tax (and insurance) for this month
+        current_tax, current_ins = escalated(
+            tax, ins, m, tax_appreciation, tax_escalation, tax_cap, ins_inflation
+        )
+        p_i, r_mo, closing_costs = rate_change(
+            by_month.get(m), balance, p_i, r_mo, term_mo, m
+        )
+
+        # pay mortgage this month
+        interest = balance * r_mo if balance > 0 else 0
+        principal = p_i - interest if balance > 0 else 0
+        if balance > 0:
+            balance -= principal
+        total_pmt = (
+            (p_i if balance > 0 else 0) + current_tax + current_ins + closing_costs
+        )
+
+        recast_amount = 0
+        # handle savings / lump only if there's still a balance
+        if balance > 0:
+            savings += surplus  # Add monthly savings first
+            if method == "Savings-based":
+                if m % recast_int == 0:
+                    extra = max(0, savings - buffer_cash)
+                    if extra > 0:
+                        recast_amount = min(
+                            extra, balance
+                        )  # Don't recast more than remaining balance
+                        balance -= recast_amount
+                        savings -= recast_amount
+                        if balance <= 0:
+                            p_i = 0
+                        else:
+                            p_i = payment(balance, term_mo - m, r_mo)
+            else:  # fixed lump
+                if m % recast_int == 0 and lump > 0 and savings >= lump:
+                    recast_amount = min(
+                        lump, balance
+                    )  # Don't recast more than remaining balance
+                    balance -= recast_amount
+                    savings -= recast_amount
+                    if balance <= 0:
+                        p_i = 0
+                    else:
+                        p_i = payment(balance, term_mo - m, r_mo)
+
+        cum_recast += recast_amount
+        cum_paid += total_pmt  # Only include regular payment in cumulative
+
+        rows.append(
+            {
+                "Month": m,
+                "P&I": p_i if balance > 0 else 0,
+                "Tax": current_tax,
+                "TotalPayment": total_pmt,
+                "CumulativePaid": cum_paid
+                + cum_recast,  # Add recast total to cumulative only when reporting
+                "Balance": balance,
+                "RecastAmount": recast_amount,
+                "CumulativeRecast": cum_recast,
+                "IsPaidOff": balance <= 0,
+                "SavingsBalance": savings,
+                "MonthlyInterest": interest,
+            }
+        )
+
+    df = pd.DataFrame(rows)
+    df["MonthlyTaxBenefit"] = tax_year_benefits(
+        df["MonthlyInterest"], df["Tax"], benefit_income, loan, start_month
+    )
+    df["EffectivePayment"] = df["TotalPayment"] - df["MonthlyTaxBenefit"]
+    return df
+
+
+def simulate_no_recast(
+    term_mo,
+    r_mo,
+    tax,
+    ins,
+    loan,
+    tax_appreciation=0.0,
+    initial_cash=0,
+    surplus=0,
+    tax_escalation="Compound",
+    tax_cap=2.0,
+    ins_inflation=0.0,
+    rate_events=(),
+):
+    balance = loan
+    p_i = payment(balance, term_mo, r_mo)
+    savings = initial_cash  # Start with initial cash
+    rows = []
+    cum_paid = 0
+    by_month = {event["month"]: event for event in rate_events}
+
+    for m in range(1, term_mo + 1):
+        # Calculate appreciated property tax (and insurance) for this month
+        current_tax, current_ins = escalated(
+            tax, ins, m, tax_appreciation, tax_escalation, tax_cap, ins_inflation
+        )
+        p_i, r_mo, closing_costs = rate_change(
+            by_month.get(m), balance, p_i, r_mo, term_mo, m
+        )
+
+        interest = balance * r_mo if balance > 0 else 0
+        principal = p_i - interest if balance > 0 else 0
+        if balance > 0:
+            balance -= principal
+        total_pmt = (
+            (p_i if balance > 0 else 0) + current_tax + current_ins + closing_costs
+        )
+
+        # Still accumulate savings, but never use them for recasting
+        savings += surplus
+
+        cum_paid += total_pmt
+
+        rows.append(
+            {
+                "Month": m,
+                "TotalPayment": total_pmt,
+                "Tax": current_tax,
+                "CumulativePaid": cum_paid,
+                "Balance": balance,
+                "IsPaidOff": balance <= 0,
+                "SavingsBalance": savings,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def run_scenario(scenario):
+    """Both reference schedules for a build_scenario() dict"""
+    no_recast_inputs = {
+        key: scenario[key]
+        for key in (
+            "term_mo",
+            "r_mo",
+            "tax",
+            "ins",
+            "loan",
+            "tax_appreciation",
+            "initial_cash",
+            "surplus",
+            "tax_escalation",
+            "tax_cap",
+            "ins_inflation",
+            "rate_events",
+        )
+    }
+    return simulate(**scenario), simulate_no_recast(**no_recast_inputs)
+
+
+def rate_path(loan, annual_rate, term_mo, events=(), caps=None):
+    """Rate, P&I, interest, balance and closing costs per month under rate events.
+
+    ``events`` are rate_path_arrays() event dicts. A reset re-amortizes the
+    balance over the rest of the loan, within the (periodic, lifetime)
+    ``caps``; a refinance starts a new loan for the balance, over its own
+    term if it has one. Stepped one month at a time until the loan ends.
+    """
+    balance = loan
+    rate = initial = annual_rate
+    end = term_mo  # last month of the current loan
+    p_i = payment(balance, term_mo, rate / 1200)
+    by_month = {event["month"]: event for event in events}
+    rows = []
+    m = 1
+    while m <= end:
+        closing_costs = 0
+        event = by_month.get(m)
+        if event is not None:
+            if event.get("kind", "Reset") == "Refinance":
+                rate = initial = event["rate"]
+                if event.get("term_mo") is not None:
+                    end = m + event["term_mo"] - 1
+                closing_costs = event.get("closing_costs", 0)
+            else:
+                new_rate = event["rate"]
+                if caps is not None:
+                    periodic, lifetime = caps
+                    new_rate = min(max(new_rate, rate - periodic), rate + periodic)
+                    new_rate = min(new_rate, initial + lifetime)
+                rate = new_rate
+            p_i = payment(balance, end - m + 1, rate / 1200)
+        interest = balance * rate / 1200
+        balance -= p_i - interest
+        rows.append(
+            {
+                "Month": m,
+                "Rate": rate,
+                "P&I": p_i,
+                "Interest": interest,
+                "Balance": balance,
+                "ClosingCosts": closing_costs,
+            }
+        )
+        m += 1
+    return pd.DataFrame(rows)
@@ -0,0 +1,119 @@
+"""HTTP API request validation and responses."""
+
+import json
+from unittest import mock
+
+import pytest
+from tornado.testing import AsyncHTTPTestCase
+
+import api
+import scenario_cache
+from mortgage import run_scenario
+from scenario_cache import ScenarioCache
+
+SCENARIO = {
+    "price": 500_000,
+    "down": 100_000,
+    "rate": 6.5,
+    "term_years": 30,
+    "tax_month": 500,
+    "ins_month": 150,
+}
+
+
+class ApiTest(AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(api, "CACHE", ScenarioCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_app(self):
+        return api.make_app()
+
+    def post(self, path, body):
+        response = self.fetch(path, method="POST", body=json.dumps(body))
+        return response.code, json.loads(response.body)
+
+    def test_summary(self):
+        code, body = self.post("/summary", SCENARIO)
+        assert code == 200
+        assert body["ending_balance"] == pytest.approx(0, abs=1e-6)
+
+    def test_invalid_scenarios_are_rejected(self):
+        for fields, error in [
+            ({"term_years": 0.5}, "term_years must be between 5 and 40"),
+            ({"term_years": 12.5}, "whole numbers"),
+            ({"surplus": None}, "surplus must be a number"),
+            ({"tax_cap": "2"}, "tax_cap must be a number"),
+            ({"ins_inflation": True}, "ins_inflation must be a number"),
+            ({"months": True}, "months must be a positive integer"),
+            ({"term_years": 50}, "term_years must be between 5 and 40"),
+            ({"term_years": 1}, "term_years must be between 5 and 40"),
+            ({"price": 20_000_000}, "price must be between 100,000 and 10,000,000"),
+            ({"recast_int": 1}, "recast_int must be between 3 and 60"),
+            ({"recast_int": 120}, "recast_int must be between 3 and 60"),
+            ({"tax_month": -1}, "tax_month must be between 0 and"),
+            ({"surplus": -500}, "surplus must be between 0 and"),
+            ({"lump": -1}, "lump must be between 0 and"),
+            ({"initial_cash": -1}, "initial_cash must be between 0 and"),
+            ({"buffer_cash": -1}, "buffer_cash must be between 0 and"),
+            ({"benefit_income": -1}, "benefit_income must be between 0 and"),
+            ({"rate_events": {"month": 24}}, "rate_events must be a list of objects"),
+            ({"rate_events": [{"month": 24.5, "rate": 7}]}, "must be an integer"),
+            ({"rate_events": [{"month": 1, "rate": 7}]}, "a month from 2"),
+            ({"rate_events": [{"month": 24, "rate": 30}]}, "between 0.1 and 15.0"),
+            ({"rate_events": [{"month": 24, "rate": 7, "term_mo": 120}]}, "term_mo"),
+            ({"rate_events": [{"month": 24, "rate": 7, "kind": "X"}]}, "kind must be"),
+        ]:
+            code, body = self.post("/simulate", dict(SCENARIO, **fields))
+            assert code == 400, fields
+            assert error in body["error"]
+
+    def test_rate_events_reamortize_both_schedules(self):
+        refinance = {
+            "month": 25,
+            "rate": 5.0,
+            "kind": "Refinance",
+            "closing_costs": 4000,
+        }
+        code, body = self.post(
+            "/simulate", dict(SCENARIO, surplus=1_000, rate_events=[refinance])
+        )
+        assert code == 200
+        for track in ("recast", "no_recast"):
+            payments = body[track]["TotalPayment"]
+            # From month 25 a lower payment, plus the closing costs that month
+            assert payments[25] < payments[23]
+            assert payments[24] == pytest.approx(payments[25] + 4000)
+
+    def test_tax_benefit_requires_loan(self):
+        code, body = self.post("/tax", {"income": 300_000, "yearly_interest": 40_000})
+        assert code == 400 and "loan" in body["error"]
+        code, body = self.post(
+            "/tax", {"income": 300_000, "yearly_interest": 40_000, "loan": 400_000}
+        )
+        assert code == 200 and body["tax_benefit"] > 0
+
+    def test_batch_misses_are_simulated_together(self):
+        other = dict(SCENARIO, rate=5.5, term_years=15)
+        batch = [SCENARIO, other, SCENARIO, dict(other, months=24)]
+        with mock.patch.object(
+            scenario_cache, "simulate_batch", wraps=scenario_cache.simulate_batch
+        ) as simulate_batch:
+            code, body = self.post("/simulate", {"batch": batch})
+        assert code == 200
+        # One pass per horizon, each distinct scenario simulated once
+        assert [len(call.args[0]) for call in simulate_batch.call_args_list] == [2, 1]
+        results = body["results"]
+        assert results[0] == results[2]
+        assert len(results[1]["recast"]["Month"]) == 180
+        assert len(results[3]["recast"]["Month"]) == 24
+        for item, result in zip(batch, results):
+            df, df_no_recast = run_scenario(
+                api.parse_scenario(item), item.get("months")
+            )
+            assert result["recast"]["Balance"] == pytest.approx(list(df["Balance"]))
+            assert result["no_recast"]["TotalPayment"] == pytest.approx(
+                list(df_no_recast["TotalPayment"])
+            )
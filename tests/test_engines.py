@@ -0,0 +1,416 @@
+"""Differential tests: every engine in mortgage.py against tests/reference.py.
+
+Hypothesis generates random scenarios (and shrinks any failure to a minimal
+one); the @example cases pin the edge cases that have bitten before.
+"""
+
+from unittest import mock
+
+import numpy as np
+import pytest
+from hypothesis import assume, example, given
+from hypothesis import strategies as st
+
+import mortgage
+import reference
+from mortgage import (
+    NO_RECAST_COLUMNS,
+    RATE_EVENT_KINDS,
+    RECAST_COLUMNS,
+    RECAST_METHODS,
+    TAX_ESCALATIONS,
+    amortize_segments,
+    build_scenario,
+    calculate_tax_benefit,
+    monthly_cost_array,
+    rate_path_arrays,
+    refinance_break_even,
+    run_scenario,
+    segment_schedule,
+    simulate_batch,
+    simulate_portfolio,
+    simulate_tracks,
+    tax_benefit_array,
+)
+from recast_kernel import HAVE_NUMBA
+
+# Dollars; engines that step month by month should agree to rounding error
+RTOL = 1e-9
+ATOL = 1e-6
+
+ENGINES = [
+    "numpy",
+    pytest.param(
+        "numba", marks=pytest.mark.skipif(not HAVE_NUMBA, reason="needs numba")
+    ),
+]
+
+
+@st.composite
+def scenarios(draw, max_years=30):
+    price = draw(st.integers(50_000, 3_000_000))
+    term_years = draw(st.integers(1, max_years))
+    return build_scenario(
+        price=price,
+        down=draw(st.integers(0, price)),
+        rate=draw(st.floats(0.25, 15)),
+        term_years=term_years,
+        tax_month=draw(st.integers(0, 5_000)),
+        ins_month=draw(st.integers(0, 1_000)),
+        tax_appreciation=draw(st.floats(0, 10)),
+        method=draw(st.sampled_from(RECAST_METHODS)),
+        recast_int=draw(st.integers(1, 60)),
+        initial_cash=draw(st.integers(0, 2_000_000)),
+        surplus=draw(st.integers(0, 50_000)),
+        buffer_cash=draw(st.integers(0, 200_000)),
+        lump=draw(st.integers(0, 500_000)),
+        benefit_income=draw(st.just(0) | st.integers(1, 2_000_000)),
+        start_month=draw(st.integers(1, 12)),
+        tax_escalation=draw(st.sampled_from(TAX_ESCALATIONS)),
+        tax_cap=draw(st.floats(0, 5)),
+        ins_inflation=draw(st.floats(0, 15)),
+        rate_events=draw(st.just([]) | rate_events(term_years * 12, within_term=True)),
+    )
+
+
+@st.composite
+def rate_events(draw, term_mo, within_term=False):
+    """Resets and refinances in distinct months, some after the loan has ended.
+
+    ``within_term`` keeps to the months and terms build_scenario() accepts.
+    """
+    last = term_mo if within_term else term_mo + 120
+    months = draw(st.lists(st.integers(2, last), max_size=4, unique=True))
+    events = []
+    for month in months:
+        event = {
+            "month": month,
+            "rate": draw(st.floats(0.25, 15)),
+            "kind": draw(st.sampled_from(RATE_EVENT_KINDS)),
+        }
+        if event["kind"] == "Refinance":
+            if not within_term:
+                event["term_mo"] = draw(st.none() | st.integers(12, 480))
+            event["closing_costs"] = draw(st.integers(0, 20_000))
+        events.append(event)
+    return events
+
+
+EXAMPLE = {
+    "price": 600_000,
+    "down": 120_000,
+    "rate": 6.5,
+    "term_years": 30,
+    "tax_month": 600,
+    "ins_month": 150,
+    "benefit_income": 250_000,
+}
+# First recast pays the loan off, so P&I drops to 0 (p_i = 0 branch)
+PAYOFF = build_scenario(**EXAMPLE, initial_cash=1_000_000)
+# Lump larger than the savings: no recast ever happens
+LUMP_OVER_SAVINGS = build_scenario(
+    **EXAMPLE, method="Fixed lump sum", initial_cash=50_000, lump=100_000
+)
+# Savings exactly equal to the lump still recast
+LUMP_EQUALS_SAVINGS = build_scenario(
+    **EXAMPLE, method="Fixed lump sum", initial_cash=100_000, lump=100_000
+)
+# Lumps until the last one is capped at the remaining balance
+LUMP_OVER_BALANCE = build_scenario(
+    **EXAMPLE, method="Fixed lump sum", initial_cash=2_000_000, lump=300_000
+)
+# No income: no deduction benefit at all
+ZERO_INCOME = build_scenario(**dict(EXAMPLE, benefit_income=0), surplus=3_000)
+# Tax years split across calendar years, with a short final year
+MID_YEAR_START = build_scenario(**dict(EXAMPLE, term_years=2), start_month=8)
+# Prop 13 style: yearly steps held to 2% while values rise 6%, premiums up 8%
+REASSESSED = build_scenario(
+    **EXAMPLE,
+    tax_appreciation=6.0,
+    tax_escalation="Annual reassessment",
+    ins_inflation=8.0,
+)
+# Cash paid outright: nothing to amortize, or to refinance
+NO_LOAN = build_scenario(
+    **dict(EXAMPLE, down=EXAMPLE["price"]),
+    rate_events=[{"month": 13, "rate": 5.0, "kind": "Refinance", "closing_costs": 1}],
+)
+# An ARM reset, then a refinance after the recasts have already paid it off
+RATE_CHANGES = build_scenario(
+    **EXAMPLE,
+    initial_cash=200_000,
+    surplus=8_000,
+    rate_events=[
+        {"month": 61, "rate": 8.0},
+        {"month": 121, "rate": 5.0, "kind": "Refinance", "closing_costs": 6_000},
+    ],
+)
+EDGE_CASES = (
+    PAYOFF,
+    LUMP_OVER_SAVINGS,
+    LUMP_EQUALS_SAVINGS,
+    LUMP_OVER_BALANCE,
+    ZERO_INCOME,
+    MID_YEAR_START,
+    REASSESSED,
+    NO_LOAN,
+    RATE_CHANGES,
+)
+
+
+def edge_cases(test):
+    for scenario in EDGE_CASES:
+        test = example(scenario)(test)
+    return test
+
+
+def payoff_residue_flipped(actual, expected):
+    """Whether the final balances are both rounding residue, of opposite sign.
+
+    The original loop charges P&I (and adds savings) only in a month that
+    ends with a positive balance, so the sign of the ~1e-11 left after the
+    last payment decides that month. NumPy's SIMD pow() can differ from
+    libm's by an ulp and land on the other side; earlier months still match.
+    """
+    last, last_ref = actual["Balance"].iloc[-1], expected["Balance"].iloc[-1]
+    return abs(last) < ATOL and abs(last_ref) < ATOL and (last > 0) != (last_ref > 0)
+
+
+def assert_schedules_match(actual, expected, columns):
+    assert len(actual) == len(expected)
+    if len(expected) and payoff_residue_flipped(actual, expected):
+        actual, expected = actual.iloc[:-1], expected.iloc[:-1]
+    for col in columns:
+        np.testing.assert_allclose(
+            actual[col].to_numpy(dtype=float),
+            expected[col].to_numpy(dtype=float),
+            rtol=RTOL,
+            atol=ATOL,
+            err_msg=col,
+        )
+
+
+def assert_runs_match(actual, expected):
+    df, df_no_recast = actual
+    ref, ref_no_recast = expected
+    assert_schedules_match(df, ref, RECAST_COLUMNS)
+    assert_schedules_match(df_no_recast, ref_no_recast, NO_RECAST_COLUMNS)
+
+
+def head(frames, months):
+    return tuple(frame.iloc[:months] for frame in frames)
+
+
+@given(scenarios())
+@edge_cases
+def test_simulate_tracks_matches_reference(scenario):
+    assert_runs_match(simulate_tracks(**scenario), reference.run_scenario(scenario))
+
+
+@given(scenarios(), st.integers(1, 360))
+def test_horizon_matches_full_term(scenario, months):
+    # A horizon only truncates; the last tax year's deductions are still complete
+    assert_runs_match(
+        simulate_tracks(**scenario, months=months),
+        head(reference.run_scenario(scenario), months),
+    )
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@given(st.lists(scenarios(), min_size=1, max_size=4), st.none() | st.integers(1, 360))
+@example(list(EDGE_CASES), None)
+@example(list(EDGE_CASES), 18)
+def test_batch_matches_reference(engine, batch, months):
+    with mock.patch.object(mortgage, "HAVE_NUMBA", engine == "numba"):
+        df, df_no_recast = simulate_batch(batch, months)
+    for i, scenario in enumerate(batch):
+        assert_runs_match(
+            (
+                df[df["Scenario"] == i].reset_index(drop=True),
+                df_no_recast[df_no_recast["Scenario"] == i].reset_index(drop=True),
+            ),
+            head(reference.run_scenario(scenario), months),
+        )
+
+
+@given(scenarios())
+@edge_cases
+def test_run_scenario_matches_reference(scenario):
+    assert_runs_match(run_scenario(scenario), reference.run_scenario(scenario))
+
+
+@given(scenarios())
+@edge_cases
+def test_single_loan_portfolio_matches_reference(scenario):
+    loans, totals = simulate_portfolio(
+        [scenario],
+        initial_cash=scenario["initial_cash"],
+        surplus=scenario["surplus"],
+        buffer_cash=scenario["buffer_cash"],
+    )
+    ref, _ = reference.run_scenario(scenario)
+    assert_schedules_match(loans, ref, mortgage.PORTFOLIO_COLUMNS[1:])
+    assert_schedules_match(totals, ref, ("RecastAmount", "SavingsBalance"))
+
+
+@given(scenarios())
+@edge_cases
+def test_closed_form_segments_match_reference(scenario):
+    ref, _ = reference.run_scenario(
+        dict(scenario, method="Fixed lump sum", lump=0, rate_events=[])
+    )
+    loan, term = scenario["loan"], scenario["term_mo"]
+    schedule = segment_schedule(
+        amortize_segments(loan, scenario["r_mo"] * 1200, term, rate_path_arrays([[]])),
+        term,
+    )
+    # Closed-form powers instead of repeated steps: allow for the error building up
+    atol = ATOL * max(loan, 1) / 1000
+    np.testing.assert_allclose(schedule["Balance"][0], ref["Balance"], atol=atol)
+    np.testing.assert_allclose(
+        schedule["Interest"][0], ref["MonthlyInterest"], atol=atol
+    )
+    # The loop reports no P&I in the month its balance reaches zero
+    np.testing.assert_allclose(
+        schedule["P&I"][0, :-1], ref["P&I"].iloc[:-1], rtol=RTOL, atol=atol
+    )
+
+
+@given(
+    scenarios(),
+    st.lists(
+        st.tuples(st.integers(2, 360), st.floats(0.25, 15)),
+        max_size=4,
+        unique_by=lambda reset: reset[0],
+    ),
+)
+def test_rate_resets_match_reference(scenario, resets):
+    loan, rate, term = scenario["loan"], scenario["r_mo"] * 1200, scenario["term_mo"]
+    resets = {month: new_rate for month, new_rate in resets if month <= term}
+    events = [{"month": month, "rate": new_rate} for month, new_rate in resets.items()]
+    schedule = segment_schedule(
+        amortize_segments(loan, rate, term, rate_path_arrays([events])), term
+    )
+    ref = reference.rate_path(loan, rate, term, events)
+    atol = ATOL * max(loan, 1) / 1000
+    for col in ("Balance", "Interest"):
+        np.testing.assert_allclose(schedule[col][0], ref[col], atol=atol)
+    np.testing.assert_allclose(schedule["P&I"][0], ref["P&I"], rtol=RTOL, atol=atol)
+
+
+@given(
+    scenarios(),
+    st.data(),
+    st.none() | st.tuples(st.floats(0, 5), st.floats(0, 10)),
+)
+def test_rate_events_match_reference(scenario, data, caps):
+    loan, rate, term = scenario["loan"], scenario["r_mo"] * 1200, scenario["term_mo"]
+    events = data.draw(rate_events(term))
+    segments = amortize_segments(loan, rate, term, rate_path_arrays([events]), caps)
+    ref = reference.rate_path(loan, rate, term, events, caps)
+    # A refinance can end the loan before or after the original term
+    assert segments["End"][0] == len(ref)
+    schedule = segment_schedule(segments, len(ref))
+    atol = ATOL * max(loan, 1) / 1000
+    for col in ("Balance", "Interest"):
+        np.testing.assert_allclose(schedule[col][0], ref[col], atol=atol)
+    for col in ("Rate", "P&I", "ClosingCosts"):
+        np.testing.assert_allclose(schedule[col][0], ref[col], rtol=RTOL, atol=atol)
+
+
+@given(
+    scenarios(),
+    st.data(),
+    st.floats(0.25, 15),
+    st.integers(0, 20_000),
+    st.none() | st.integers(12, 480),
+)
+def test_refinance_break_even_matches_month_scan(
+    scenario, data, new_rate, closing_costs, new_term
+):
+    loan, rate, term = scenario["loan"], scenario["r_mo"] * 1200, scenario["term_mo"]
+    refi_month = data.draw(st.integers(2, term))
+    refinance = {
+        "month": refi_month,
+        "rate": new_rate,
+        "kind": "Refinance",
+        "term_mo": new_term,
+        "closing_costs": closing_costs,
+    }
+    kept = reference.rate_path(loan, rate, term)["Interest"].tolist()
+    refinanced = reference.rate_path(loan, rate, term, [refinance])["Interest"]
+    refinanced = refinanced.tolist()
+    horizon = max(len(kept), len(refinanced))
+    kept += [0.0] * (horizon - len(kept))
+    refinanced += [0.0] * (horizon - len(refinanced))
+    # Closed-form interest differs from the stepped loop by rounding
+    tie = ATOL * max(loan, 1) / 1000 * horizon
+
+    expected = np.nan
+    saved = 0.0
+    for m in range(1, horizon + 1):
+        saved += kept[m - 1] - refinanced[m - 1]
+        if m < refi_month:
+            continue
+        assume(abs(saved - closing_costs) > tie)
+        if saved >= closing_costs:
+            expected = m - refi_month + 1
+            break
+
+    np.testing.assert_equal(
+        refinance_break_even(
+            loan, rate, term, refi_month, new_rate, closing_costs, new_term
+        ),
+        expected,
+    )
+
+
+@given(scenarios())
+@edge_cases
+def test_monthly_cost_matches_first_month(scenario):
+    # Flat property tax, a January start and no recast in the first year, so
+    # month 1 carries a full year's average deduction
+    scenario = dict(
+        scenario,
+        tax_appreciation=0.0,
+        start_month=1,
+        method="Fixed lump sum",
+        lump=0,
+        rate_events=[],
+    )
+    ref, _ = reference.run_scenario(scenario)
+    inputs = {
+        "price": scenario["loan"] + 100_000,
+        "down": 100_000,
+        "rate": scenario["r_mo"] * 1200,
+        "term_years": scenario["term_mo"] // 12,
+        "tax_month": scenario["tax"],
+        "ins_month": scenario["ins"],
+        "benefit_income": scenario["benefit_income"],
+    }
+    first = ref.iloc[0]
+    np.testing.assert_allclose(
+        monthly_cost_array(**inputs), first["TotalPayment"], rtol=RTOL
+    )
+    np.testing.assert_allclose(
+        monthly_cost_array(**inputs, effective=True),
+        first["EffectivePayment"],
+        rtol=RTOL,
+        atol=ATOL,
+    )
+
+
+@given(
+    st.floats(0, 500_000),
+    st.floats(0, 5_000),
+    st.floats(0, 3_000_000),
+    st.integers(0, 5_000_000),
+    st.sampled_from(("married", "single")),
+)
+def test_tax_benefit_array_matches_scalar(interest, tax, income, loan, status):
+    np.testing.assert_allclose(
+        tax_benefit_array(interest, tax, income, loan, status),
+        calculate_tax_benefit(interest, tax, income, loan, status),
+        rtol=RTOL,
+        atol=ATOL,
+    )
@@ -0,0 +1,82 @@
+"""Affordability solver: goal_seek() against monthly_cost_array()."""
+
+import numpy as np
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from mortgage import MAX_PRICE, goal_seek, monthly_cost_array
+
+TOL = 1.0
+# The sidebar's solve_for choices and what each moves
+SOLVE_FOR = {"Maximum price": "price", "Minimum down payment": "down"}
+
+
+@st.composite
+def cost_inputs(draw):
+    return {
+        "rate": draw(st.floats(0.25, 15)),
+        "term_years": draw(st.integers(5, 40)),
+        "tax_month": draw(st.integers(0, 3_000)),
+        "ins_month": draw(st.integers(0, 1_000)),
+        "tax_pct": draw(st.none() | st.floats(0, 3)),
+        "benefit_income": draw(st.just(0) | st.integers(1, 2_000_000)),
+        "effective": draw(st.booleans()),
+    }
+
+
+def cost(solve_for, x, price, down, inputs):
+    if solve_for == "price":
+        return monthly_cost_array(x, down, **inputs)
+    return monthly_cost_array(price, x, **inputs)
+
+
+@pytest.mark.parametrize("choice", SOLVE_FOR)
+@given(
+    inputs=cost_inputs(),
+    price=st.integers(100_000, 5_000_000),
+    down_share=st.floats(0, 1),
+    target=st.floats(500, 50_000),
+)
+def test_solution_is_the_limit_within_tol(choice, inputs, price, down_share, target):
+    solve_for = SOLVE_FOR[choice]
+    down = round(price * down_share)
+    solution = goal_seek(solve_for, target, price, down, tol=TOL, **inputs)
+    if np.isnan(solution):
+        # Only when even no loan at all is over the target
+        cheapest = down if solve_for == "price" else price
+        assert cost(solve_for, cheapest, price, down, inputs) > target
+        return
+    assert cost(solve_for, solution, price, down, inputs) <= target
+    # One tol further (a dearer price or a smaller down payment) is over
+    if solve_for == "price" and solution < MAX_PRICE:
+        assert cost(solve_for, solution + TOL, price, down, inputs) > target
+    if solve_for == "down" and solution > 0:
+        assert cost(solve_for, solution - TOL, price, down, inputs) > target
+
+
+@pytest.mark.parametrize("choice", SOLVE_FOR)
+def test_taxes_and_insurance_over_target_is_nan(choice):
+    inputs = {"rate": 6.5, "term_years": 30, "tax_month": 1_500, "ins_month": 600}
+    solution = goal_seek(SOLVE_FOR[choice], 2_000, 800_000, 200_000, **inputs)
+    assert np.isnan(solution)
+    # Broadcast over several targets, only the unreachable ones are NaN
+    solutions = goal_seek(SOLVE_FOR[choice], [2_000, 6_000], 800_000, 200_000, **inputs)
+    assert np.isnan(solutions[0]) and not np.isnan(solutions[1])
+
+
+def test_price_is_capped_at_max_price():
+    inputs = {"rate": 6.5, "term_years": 30, "tax_month": 500, "ins_month": 150}
+    assert goal_seek("price", 1e9, None, 100_000, **inputs) == MAX_PRICE
+    # A percentage-based tax grows with the price, but the cap still holds
+    assert goal_seek("price", 1e9, None, 100_000, **inputs, tax_pct=1.2) == MAX_PRICE
+
+
+def test_down_payment_bottoms_out_at_zero():
+    inputs = {"rate": 6.5, "term_years": 30, "tax_month": 500, "ins_month": 150}
+    assert goal_seek("down", 1e9, MAX_PRICE, 0, **inputs) == 0
+    # The whole price in cash is the most it can ask for
+    tight = monthly_cost_array(MAX_PRICE, MAX_PRICE, **inputs)
+    assert goal_seek("down", tight, MAX_PRICE, 0, **inputs) == pytest.approx(
+        MAX_PRICE, abs=TOL
+    )
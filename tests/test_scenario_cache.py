@@ -0,0 +1,87 @@
+"""Disk cache recovery, eviction and recency."""
+
+import sqlite3
+from unittest import mock
+
+import pandas as pd
+
+from mortgage import build_scenario, run_scenario
+from scenario_cache import DiskCache, ScenarioCache, scenario_key
+
+
+def scenario(rate):
+    return build_scenario(400_000, 80_000, rate, 30, 400, 120, surplus=1_500)
+
+
+def stored_keys(path):
+    with sqlite3.connect(path) as conn:
+        return {key for (key,) in conn.execute("SELECT key FROM schedules")}
+
+
+def stored_bytes(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT SUM(size) FROM schedules").fetchone()[0]
+
+
+def test_corrupt_database_is_moved_aside(tmp_path):
+    path = tmp_path / "schedules.sqlite"
+    path.write_bytes(b"not a database" * 100)
+    disk = DiskCache(str(path))
+    assert (tmp_path / "schedules.sqlite.corrupt").read_bytes().startswith(b"not a")
+    result = run_scenario(scenario(6.0))
+    disk.put("key", result)
+    pd.testing.assert_frame_equal(disk.get("key")[0], result[0])
+
+
+def test_unreadable_entry_is_a_miss_and_dropped(tmp_path):
+    path = str(tmp_path / "schedules.sqlite")
+    disk = DiskCache(path)
+    disk.put("key", run_scenario(scenario(6.0)))
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE schedules SET recast = ?", (b"garbage",))
+    assert disk.get("key") is None
+    assert stored_keys(path) == set()
+
+
+def test_locked_database_is_a_miss_not_a_discard(tmp_path):
+    path = str(tmp_path / "schedules.sqlite")
+    disk = DiskCache(path, touch_interval=0, timeout=0.05)
+    disk.put("key", run_scenario(scenario(6.0)))
+    locked = sqlite3.OperationalError("database is locked")
+    with mock.patch.object(disk, "_connect", return_value=mock.Mock()) as connect:
+        connect.return_value.execute.side_effect = locked
+        assert disk.get("key") is None
+    assert stored_keys(path) == {"key"}
+    # A read that can't record its access time still returns the result
+    with sqlite3.connect(path, isolation_level=None) as other:
+        other.execute("BEGIN IMMEDIATE")
+        assert disk.get("key") is not None
+        other.execute("ROLLBACK")
+    assert stored_keys(path) == {"key"}
+
+
+def test_eviction_trims_to_90_percent(tmp_path):
+    path = str(tmp_path / "schedules.sqlite")
+    disk = DiskCache(path)
+    results = [run_scenario(scenario(5.0 + i / 4)) for i in range(10)]
+    disk.put("0", results[0])
+    disk.max_bytes = int(stored_bytes(path) * 4.5)
+    for i, result in enumerate(results[1:], 1):
+        disk.put(str(i), result)
+        assert stored_bytes(path) <= disk.max_bytes
+    # Each eviction drops the oldest entries until 90% of the limit is left
+    assert stored_keys(path) == {"6", "7", "8", "9"}
+    assert stored_bytes(path) <= disk.max_bytes * 0.9
+
+
+def test_memory_hits_keep_disk_entries_fresh(tmp_path):
+    path = str(tmp_path / "schedules.sqlite")
+    disk = DiskCache(path, touch_interval=0)
+    cache = ScenarioCache(disk=disk)
+    popular = scenario(6.0)
+    cache.schedules(popular)
+    disk.max_bytes = int(stored_bytes(path) * 3.5)
+    for i in range(8):
+        cache.schedules(scenario(5.0 + i / 4))
+        cache.schedules(popular)  # served from memory every time
+    assert scenario_key(dict(popular, months=None)) in stored_keys(path)
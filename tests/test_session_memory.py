@@ -0,0 +1,59 @@
+"""Session ledger: sizes, idle expiry and the recycle decision."""
+
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+import session_memory
+from session_memory import SessionMonitor, memory_size
+
+HOUR = 3600
+
+
+def test_memory_size_follows_frames_arrays_and_figures():
+    df = pd.DataFrame({"Balance": np.zeros(1_000)})
+    assert memory_size(df) >= 8_000
+    assert memory_size([df, df]) < 2 * memory_size(df)  # shared objects count once
+    fig = go.Figure(go.Scatter(x=np.arange(1_000), y=np.zeros(1_000)))
+    assert memory_size(fig) >= 16_000
+
+
+def test_idle_sessions_leave_the_ledger():
+    monitor = SessionMonitor(idle_seconds=HOUR)
+    now = time.monotonic()
+    with mock.patch("time.monotonic", return_value=now - 2 * HOUR):
+        monitor.record("idle", schedules=[pd.DataFrame({"a": [1.0]})])
+    monitor.record("busy", session_state={"inputs": [1] * 100})
+    assert set(monitor.usage()) == {"busy", "idle"}
+    assert monitor.usage()["idle"]["schedules"] > 0
+    assert monitor.usage()["busy"]["session_state"] > 0
+
+    assert not monitor.check(now)
+    assert set(monitor.usage()) == {"busy"}
+
+
+def test_recycle_waits_for_sessions_to_go_idle():
+    monitor = SessionMonitor(idle_seconds=HOUR, recycle_mb=100)
+    now = time.monotonic()
+    monitor.record("active", session_state={})
+    with mock.patch.object(session_memory, "rss_bytes", return_value=50 * 2**20):
+        assert not monitor.check(now)
+    with mock.patch.object(session_memory, "rss_bytes", return_value=200 * 2**20):
+        assert not monitor.check(now)  # over the limit, but a session is active
+        assert monitor.over_limit_since == now
+        assert monitor.check(now + 2 * HOUR)
+
+
+def test_busy_worker_recycles_after_the_drain_deadline(caplog):
+    monitor = SessionMonitor(idle_seconds=HOUR, recycle_mb=100, drain_seconds=600)
+    now = time.monotonic()
+    monitor.record("small", session_state={})
+    monitor.record("large", schedules=[pd.DataFrame({"a": np.zeros(100_000)})])
+    with mock.patch.object(session_memory, "rss_bytes", return_value=200 * 2**20):
+        assert not monitor.check(now)
+        assert "Largest sessions: large 0.8 MB, small" in caplog.text
+        assert not monitor.check(now + 599)
+        assert monitor.check(now + 600)  # both sessions still active
@@ -0,0 +1,90 @@
+"""Compact sweep output against the full-precision simulate_arrays() arrays."""
+
+from unittest import mock
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from mortgage import build_scenario, simulate_arrays
+from sweep import ScenarioRows, decode, open_sweep, run_sweep, yearly_values
+
+INPUTS = pa.table(
+    {
+        "price": [600_000, 900_000, 450_000, 1_200_000, 750_000],
+        "down": [120_000, 200_000, 90_000, 300_000, 150_000],
+        "rate": [6.5, 5.75, 7.0, 6.25, 6.0],
+        "term_years": [30, 15, 40, 30, 20],
+        "tax_month": [600, 900, 450, 1_200, 750],
+        "ins_month": [150, 200, 100, 250, 150],
+        "initial_cash": [50_000, 0, 10_000, 250_000, None],
+        "surplus": [2_000, 5_000, 500, 3_000, 1_000],
+        "benefit_income": [250_000, 400_000, 0, 600_000, 180_000],
+    }
+)
+
+
+def full_precision(rows, months=None):
+    out, out_base = simulate_arrays(rows[:], months)
+    return dict(out, NoRecastBalance=out_base["Balance"])
+
+
+@pytest.mark.parametrize("dtype, atol", [("float32", 1.0), ("cents", 0.005)])
+def test_monthly_columns_round_trip(tmp_path, dtype, atol):
+    rows = ScenarioRows(INPUTS)
+    columns = ("TotalPayment", "Balance", "NoRecastBalance")
+    # Chunks smaller than the sweep, with terms shorter than the widest
+    meta = run_sweep(rows, tmp_path, columns, dtype, chunk_size=2)
+    meta, stored = open_sweep(tmp_path)
+    assert meta["periods"] == 480 and meta["count"] == 5
+    expected = full_precision(rows)
+    for col in columns:
+        assert stored[col].dtype == (np.float32 if dtype == "float32" else np.int32)
+        values = decode(stored[col])
+        np.testing.assert_array_equal(np.isnan(values), np.isnan(expected[col]))
+        np.testing.assert_allclose(values, expected[col], rtol=1e-6, atol=atol)
+
+
+def test_rows_are_converted_once(tmp_path):
+    rows = ScenarioRows(INPUTS)
+    with mock.patch.object(
+        ScenarioRows, "_scenario", side_effect=ScenarioRows._scenario
+    ) as convert:
+        meta = run_sweep(rows, tmp_path, chunk_size=2)
+    # The horizon comes from the term_years column, not a pass over the rows
+    assert meta["months"] == 480 and convert.call_count == len(rows)
+
+
+def test_yearly_snapshots(tmp_path):
+    rows = ScenarioRows(INPUTS)
+    run_sweep(rows, tmp_path, ("TotalPayment", "Balance"), yearly=True, months=100)
+    meta, stored = open_sweep(tmp_path)
+    expected = full_precision(rows, 100)
+    assert meta["period"] == "year" and stored["Balance"].shape == (5, 9)
+    # Payments are year totals; balances are the last month of each year
+    np.testing.assert_allclose(
+        stored["TotalPayment"][:, 0], expected["TotalPayment"][:, :12].sum(axis=1)
+    )
+    np.testing.assert_allclose(
+        stored["TotalPayment"][:, -1], expected["TotalPayment"][:, 96:].sum(axis=1)
+    )
+    np.testing.assert_allclose(stored["Balance"][:, -1], expected["Balance"][:, 99])
+
+
+def test_yearly_values_skip_months_past_term():
+    values = np.array([[1.0] * 18 + [np.nan] * 18])
+    np.testing.assert_array_equal(
+        yearly_values(values, "TotalPayment"), [[12, 6, np.nan]]
+    )
+    np.testing.assert_array_equal(yearly_values(values, "Balance"), [[1, 1, np.nan]])
+
+
+def test_cents_overflow_is_rejected(tmp_path):
+    scenario = build_scenario(30_000_000, 0, 6.5, 30, 0, 0)
+    with pytest.raises(ValueError, match="int32 cents"):
+        run_sweep([scenario], tmp_path, ("CumulativePaid",), "cents")
+
+
+def test_unknown_column_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="unknown columns: Equity"):
+        run_sweep(ScenarioRows(INPUTS), tmp_path, ("Equity",))